@@ -0,0 +1,4156 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#-------------------------------------------------------------------------------
+# Name:        isogramlib
+# Purpose:     The implementation of isograms.py, which only imports it for
+#              anything more than a quick query
+#
+# Author:      Florian Breit <florian.breit.12@ucl.ac.uk>
+#
+# Created:     18/10/2026, split off from isograms.py
+# Last Update: 18/10/2026
+# Copyright:   (c) Florian Breit 2014, 2015
+# Licence:     Affero General Public License Version 3, or
+#-------------------------------------------------------------------------------
+
+import unicodedata
+import os
+import gzip
+import sys
+import array
+import asyncio
+import codecs
+import collections
+import cProfile
+import hashlib
+import mmap
+import multiprocessing
+import pstats
+import random
+import shutil
+import sqlite3
+import subprocess
+import tempfile
+import time
+from optparse import OptionParser
+import fnmatch
+import functools
+import heapq
+import json
+import re
+import signal
+import stat
+import struct
+
+from isograms import isogram, queryStream
+
+#Optional, see classifyBatch()
+try:
+    import numpy
+except ImportError:
+    numpy = None
+#Optional before Python 3.11, see readManifest()
+try:
+    import tomllib
+except ImportError:
+    try:
+        import tomli as tomllib
+    except ImportError:
+        tomllib = None
+
+def main():
+    #Parse command line arguments
+    usage = "Usage: %prog [-i] STRING\n"
+    usage+= "       %prog --stdin\n"
+    usage+= "       %prog --serve=SOCKET\n"
+    usage+= "       %prog --test\n"
+    usage+= "       %prog --benchmark [--words=N] [--outfile=RESULTS]\n"
+    usage+= "       %prog --ngrams --indir=INDIR   --outfile=OUTFILE [--jobs=N]\n"
+    usage+= "       %prog --bnc    --infile=INFILE --outfile=OUTFILE\n"
+    usage+= "       %prog --ngrams --detect --indir=INDIR   --outfile=OUTFILE [--wordlist=FILE]\n"
+    usage+= "       %prog --bnc    --detect --infile=INFILE --outfile=OUTFILE [--wordlist=FILE]\n"
+    usage+= "       %prog --batch  --infile=INFILE --outfile=OUTFILE\n"
+    usage+= "       %prog --batch  --infile=INFILE --sqlite=DATABASE --table=NAME\n"
+    usage+= "       %prog --export --infile=INFILE --outfile=OUTFILE\n"
+    usage+= "       %prog --top=K [--by=COLUMNS] [--min-cpm=X] --infile=ISOGRAMS --outfile=OUTFILE\n"
+    usage+= "       %prog --partitions=PATTERNS --infile=SHARDS --sqlite=DATABASE --table=NAME\n"
+    usage+= "       %prog --index=INDEX --query-letters=LETTERS ...\n"
+    usage+= "       %prog --manifest=MANIFEST [--jobs=N]\n"
+    parser = OptionParser(usage=usage, version="%prog 1.0")
+    parser.add_option("", "--test", action="store_true", dest="test",
+                      help="Run some tests to make sure the program works.",
+                      default=False)
+    parser.add_option("", "--benchmark", action="store_true", dest="benchmark",
+                      help="Time the pipeline on a generated corpus of"
+                      + " --words words, writing the results as JSON to"
+                      + " --outfile (if given) and keeping the corpus in"
+                      + " --indir (if given).", default=False)
+    parser.add_option("", "--words", dest="words", type="int", metavar="N",
+                      help="Number of distinct words in the --benchmark"
+                      + " corpus (default %default).", default=100000)
+    parser.add_option("", "--ngrams", action="store_true", dest="ngrams",
+                      help="Prepare a wordlist from a Google 1gram directory."
+                      + " Requires --indir and --outfile.", default=False)
+    parser.add_option("", "--bnc", action="store_true", dest="bnc",
+                      help="Prepare a wordlist from the BNC frequency list."
+                      + " Requires --infile and --outfile.", default=False)
+    parser.add_option("", "--detect", action="store_true", dest="detect",
+                      help="With --ngrams or --bnc, extract the isograms into"
+                      + " OUTFILE in the same pass, without writing the word"
+                      + " list unless --wordlist is given.", default=False)
+    parser.add_option("", "--wordlist", dest="wordlist", metavar="FILE",
+                      help="Also write the word list to FILE with --detect.")
+    parser.add_option("-b", "--batch", action="store_true", dest="batch",
+                      help="Batch process a given word list."
+                      + " Requires --indir and --outfile.", default=False)
+    parser.add_option("-i", "--isogramy", dest="isogramy", metavar="STRING",
+                      help="Return the isogramy of STRING. Returns 0 if STRING"
+                      + " is not an isogram.")
+    parser.add_option("", "--stdin", action="store_true", dest="stdin",
+                      help="Read words from standard input, one per line, and"
+                      + " print the isogramy of each.", default=False)
+    parser.add_option("", "--serve", dest="serve", metavar="SOCKET",
+                      help="Answer isogramy queries on the Unix SOCKET, one"
+                      + " word per line, until interrupted.", default=None)
+    parser.add_option("-f", "--infile", dest="infile", metavar="FILE",
+                      help="Specify FILE as the input file for --batch.")
+    parser.add_option("-o", "--outfile", dest="outfile", metavar="FILE",
+                      help="Specify FILE as the output file for --ngrams or"
+                      + " --batch.")
+    parser.add_option("-d", "--indir", dest="indir", metavar="DIRECTORY",
+                      help="Specify DIRECTORY as the input directory for"
+                      + " --ngrams.")
+    parser.add_option("", "--format", dest="wordlist_format", metavar="FORMAT",
+                      type="choice", choices=["tsv", "columns"],
+                      help="Write the word list from --ngrams or --bnc as tab"
+                      + " separated text (tsv) or in a compact binary columnar"
+                      + " format (columns) which --batch can read faster"
+                      + " (default %default).", default="tsv")
+    parser.add_option("", "--export", action="store_true", dest="export",
+                      help="Convert the word list INFILE to tab separated text."
+                      + " Requires --infile and --outfile.", default=False)
+    parser.add_option("", "--sqlite", dest="database", metavar="DATABASE",
+                      help="Load the isograms from --batch straight into the"
+                      + " SQLite DATABASE, instead of or as well as OUTFILE.")
+    parser.add_option("", "--table", dest="table", metavar="NAME",
+                      help="Load the isograms into table NAME of the --sqlite"
+                      + " database, usually bnc or ngrams (default bnc with"
+                      + " --bnc, ngrams otherwise).")
+    parser.add_option("", "--years", dest="years", metavar="FILE",
+                      help="With --ngrams, also write the per-year counts of"
+                      + " each ngram to FILE and the per-year totals to"
+                      + " FILE.totals. Read by --decades.", default=None)
+    parser.add_option("", "--decades", dest="decades", metavar="FILE",
+                      help="Write the counts per million of the isograms in"
+                      + " each decade to FILE with --batch or --detect, from"
+                      + " the --years FILE.", default=None)
+    parser.add_option("", "--shards", dest="shards", metavar="FILE",
+                      help="Also write the isograms from --batch or --detect"
+                      + " to FILE in separately compressed shards, with a"
+                      + " manifest in FILE.manifest.", default=None)
+    parser.add_option("", "--partition", dest="partition", metavar="BY",
+                      type="choice", choices=ISOGRAM_PARTITIONS,
+                      help="Partition the --shards by isogramy (and length)"
+                      + " or by initial letter (default %default).",
+                      default="isogramy")
+    parser.add_option("", "--partitions", dest="partitions",
+                      metavar="PATTERNS", help="Only read the shards whose"
+                      + " keys match any of the comma separated PATTERNS"
+                      + " from the sharded isogram file --infile, e.g. 2-*"
+                      + " for all 2-isograms.", default=None)
+    parser.add_option("", "--properties", dest="properties", metavar="LIST",
+                      help="Comma separated properties to classify with"
+                      + " --batch or --detect, each adding a column: "
+                      + ", ".join([entry[0] for entry in WORD_PROPERTIES])
+                      + " (default %s)." % ",".join(DEFAULT_PROPERTIES),
+                      default=None)
+    parser.add_option("", "--top", dest="top", type="int", metavar="K",
+                      help="Only write the K most frequent isograms (per group"
+                      + " of --by) with --batch or --detect, or select them"
+                      + " from the isogram file --infile on its own.",
+                      default=None)
+    parser.add_option("", "--by", dest="by", metavar="COLUMNS",
+                      help="Comma separated columns to group --top by, e.g."
+                      + " isogramy,length.", default=None)
+    parser.add_option("", "--min-cpm", dest="min_cpm", type="float",
+                      metavar="X", help="Only write isograms with at least X"
+                      + " counts per million, like --top.", default=None)
+    parser.add_option("", "--index", dest="index", metavar="FILE",
+                      help="Build a letter signature index FILE with --batch,"
+                      + " or look words up in it with the --query options.")
+    parser.add_option("", "--query-letters", dest="query_letters",
+                      metavar="LETTERS", help="Find words made up of exactly"
+                      + " the set of LETTERS in the --index.")
+    parser.add_option("", "--query-mask", dest="query_mask", metavar="MASK",
+                      help="Find words with exactly the 26-bit letter MASK"
+                      + " (bit 0 is a, e.g. 0x7 for abc) in the --index.")
+    parser.add_option("", "--query-anagrams", dest="query_anagrams",
+                      metavar="WORD", help="Find anagrams of WORD in the"
+                      + " --index.")
+    parser.add_option("", "--query-avoid", dest="query_avoid",
+                      metavar="LETTERS", help="Find words without any of the"
+                      + " LETTERS (lipograms) in the --index.")
+    parser.add_option("", "--query-isogramy", dest="query_isogramy", type="int",
+                      metavar="N", help="Find N-isograms in the --index.")
+    parser.add_option("", "--query-length", dest="query_length", type="int",
+                      metavar="N", help="Find words of length N in the"
+                      + " --index.")
+    parser.add_option("", "--manifest", dest="manifest", metavar="MANIFEST",
+                      help="Process all corpora listed in the JSON or TOML"
+                      + " MANIFEST concurrently, sharing --jobs worker slots"
+                      + " (default from the manifest or the number of CPUs).")
+    parser.add_option("", "--buffer-size", dest="bufsize", type="int",
+                      metavar="MB", help="Decompress input files MB megabytes"
+                      + " at a time with --ngrams or --bnc.", default=None)
+    parser.add_option("", "--decompressor", dest="decompressor",
+                      metavar="PROGRAM", help="Decompress input files with"
+                      + " PROGRAM (e.g. pigz or zcat), or 'python' to do it"
+                      + " in-process. Defaults to pigz if it is installed.",
+                      default="auto")
+    parser.add_option("-q", "--quiet", action="store_true", dest="quiet",
+                      help="Do not report progress.", default=False)
+    parser.add_option("", "--progress-json", action="store_true",
+                      dest="progress_json", help="Report progress as JSON"
+                      + " lines on stderr instead of text.", default=False)
+    parser.add_option("", "--progress-interval", dest="progress_interval",
+                      type="float", metavar="SECONDS", help="Report progress"
+                      + " every SECONDS seconds (default %default).",
+                      default=2.0)
+    parser.add_option("", "--profile", dest="profile", metavar="PREFIX",
+                      help="Profile each stage, writing the statistics to"
+                      + " PREFIX.STAGE.pstats and listing the slowest"
+                      + " functions at the end.", default=None)
+    parser.add_option("", "--metrics", dest="metrics", metavar="FILE",
+                      help="Write the timings and counters of each stage to"
+                      + " FILE, in the Prometheus text format if it ends in"
+                      + " .prom and as JSON otherwise.", default=None)
+    parser.add_option("", "--checkpoint", action="store_true",
+                      dest="checkpoint", help="Keep partial files and a"
+                      + " checkpoint manifest next to OUTFILE with --ngrams,"
+                      + " which let a later run skip unchanged files.",
+                      default=False)
+    parser.add_option("", "--consolidate", action="store_true",
+                      dest="consolidate", help="Combine all entries with the"
+                      + " same tidied word into one with --ngrams or --bnc.",
+                      default=False)
+    parser.add_option("", "--memory", dest="memory", type="int", metavar="MB",
+                      help="Use about MB megabytes of memory for --consolidate"
+                      + " before spilling to disk (default 1024).",
+                      default=None)
+    parser.add_option("", "--tmpdir", dest="tmpdir", metavar="DIR",
+                      help="Write temporary files for --ngrams, --bnc or"
+                      + " --consolidate to DIR (default the system's"
+                      + " temporary directory).", default=None)
+    parser.add_option("-j", "--jobs", dest="jobs", type="int", metavar="N",
+                      help="Prepare N ngram files in parallel with --ngrams,"
+                      + " or share N worker slots with --manifest.",
+                      default=None)
+    (opts, args) = parser.parse_args()
+    if(opts.bufsize is not None):
+        opts.bufsize *= 1024 * 1024
+    if(opts.memory is not None):
+        opts.memory *= 1024 * 1024
+    if(opts.jobs is None and opts.manifest is None):
+        opts.jobs = 1
+    progress = Progress(opts.progress_interval, opts.quiet, opts.progress_json,
+                        profile=opts.profile)
+    if(opts.table is None):
+        opts.table = "bnc" if opts.bnc else "ngrams"
+    if(not TABLE_NAME_PATTERN.match(opts.table)):
+        print("Invalid table name %s for --table, use only letters, digits and"
+              % opts.table + " underscores.\nTry --help for more information.")
+        exit(2)
+    if(opts.decompressor not in ("auto", "python") and shutil.which(opts.decompressor) is None):
+        print("Cannot find the program %s for --decompressor, install it or use"
+              % opts.decompressor + " --decompressor=python.\nTry --help for"
+              + " more information.")
+        exit(2)
+    if(opts.properties is not None):
+        opts.properties = [name.strip() for name in opts.properties.split(",") if name.strip()]
+        names = [entry[0] for entry in WORD_PROPERTIES]
+        for name in opts.properties:
+            if(name not in names):
+                print("Unknown property %s for --properties, use one of %s.\nTry"
+                      % (name, ", ".join(names)) + " --help for more information.")
+                exit(2)
+    if(opts.by is not None):
+        opts.by = [column.strip() for column in opts.by.split(",") if column.strip()]
+        columns = [name for (name, kind) in isogramColumns(opts.properties)]
+        for column in opts.by:
+            if(column not in columns):
+                print("Unknown column %s for --by, use one of %s.\nTry --help"
+                      % (column, ", ".join(columns)) + " for more information.")
+                exit(2)
+    if(opts.partitions is not None):
+        opts.partitions = [pattern.strip() for pattern in opts.partitions.split(",") if pattern.strip()]
+        if(opts.batch or opts.ngrams or opts.bnc):
+            print("The option --partitions only selects shards from a sharded"
+            + " --infile, not with --batch, --ngrams or --bnc.\nTry --help for"
+            + " more information.")
+            exit(2)
+    select = opts.top is not None or opts.min_cpm is not None or opts.partitions is not None
+    if((opts.top is not None or opts.min_cpm is not None)
+       and (opts.ngrams or opts.bnc) and not opts.detect):
+        print("The options --top and --min-cpm select isograms, so with --ngrams"
+        + " or --bnc they require --detect.\nTry --help for more information.")
+        exit(2)
+    if(opts.decades is not None and opts.years is None):
+        print("The option --decades requires --years to be specified.\nTry"
+        + " --help for more information.")
+        exit(2)
+    if(opts.years is not None and opts.bnc):
+        print("The BNC has no per-year counts, so --years only works with"
+        + " --ngrams, --batch or --top.\nTry --help for more information.")
+        exit(2)
+
+    #Make sure only one of --test, --ngrams, --batch, --isogramy is given.
+    count_opts = 0;
+    if(opts.test): count_opts +=1
+    if(opts.benchmark): count_opts +=1
+    if(opts.ngrams): count_opts +=1
+    if(opts.batch): count_opts +=1
+    if(opts.isogramy): count_opts +=1
+    if(opts.stdin): count_opts +=1
+    if(opts.serve): count_opts +=1
+    if(opts.export): count_opts +=1
+    if(opts.manifest): count_opts +=1
+    if(select and not (opts.batch or opts.ngrams or opts.bnc)): count_opts +=1
+    query = [opts.query_letters, opts.query_mask, opts.query_anagrams,
+             opts.query_avoid, opts.query_isogramy, opts.query_length]
+    if(query.count(None) < len(query)): count_opts +=1
+    if(count_opts > 1):
+        print("The options --test, --ngrams, --batch and --isogramy are mutually"
+        + " exclusive.\nTry --help for more information.")
+        exit(2)
+
+    #Process options
+    if(opts.test):
+        test()
+        exit()
+    if(opts.benchmark):
+        benchmark(opts.outfile, opts.words, opts.indir)
+        exit()
+    if(opts.manifest):
+        try:
+            failed = runManifest(opts.manifest, opts.jobs, progress)
+        except (OSError, ValueError) as e:
+            print("Cannot read the --manifest %s: %s\nTry --help for more"
+                  % (opts.manifest, e) + " information.")
+            exit(2)
+        exit(1 if failed else 0)
+    if(opts.ngrams and opts.detect):
+        if(opts.indir is None or (opts.outfile is None and opts.database is None and opts.shards is None)):
+            print("The options --ngrams --detect require both --indir and"
+            + " --outfile (or --sqlite or --shards) to be specified.\nTry --help"
+            + " for more information.")
+            exit(2)
+        print("Extracting isograms from 1grams in %s..." % opts.indir)
+        print("")
+        detectNgrams(opts.indir, opts.outfile, opts.wordlist, progress=progress,
+                     database=opts.database, table=opts.table,
+                     index=opts.index, jobs=opts.jobs, bufsize=opts.bufsize,
+                     decompressor=opts.decompressor,
+                     checkpoint=opts.checkpoint,
+                     wordlist_format=opts.wordlist_format,
+                     consolidate=opts.consolidate, memory=opts.memory,
+                     top=opts.top, by=opts.by, min_cpm=opts.min_cpm,
+                     properties=opts.properties, years=opts.years,
+                     decades=opts.decades, shards=opts.shards,
+                     partition=opts.partition, tmpdir=opts.tmpdir)
+        print("")
+        print("Processing of isograms complete.")
+        progress.summary()
+        if(opts.metrics):
+            progress.writeMetrics(opts.metrics)
+        exit()
+    if(opts.bnc and opts.detect):
+        if(opts.infile is None or (opts.outfile is None and opts.database is None and opts.shards is None)):
+            print("The options --bnc --detect require both --infile and"
+            + " --outfile (or --sqlite or --shards) to be specified.\nTry --help"
+            + " for more information.")
+            exit(2)
+        print("Extracting isograms from BNC word list %s..." % opts.infile)
+        print("")
+        detectBNC(opts.infile, opts.outfile, opts.wordlist, progress=progress,
+                  database=opts.database, table=opts.table, index=opts.index,
+                  bufsize=opts.bufsize, decompressor=opts.decompressor,
+                  wordlist_format=opts.wordlist_format,
+                  consolidate=opts.consolidate, memory=opts.memory,
+                  top=opts.top, by=opts.by, min_cpm=opts.min_cpm,
+                  properties=opts.properties, shards=opts.shards,
+                  partition=opts.partition, tmpdir=opts.tmpdir)
+        print("")
+        print("Processing of isograms complete.")
+        progress.summary()
+        if(opts.metrics):
+            progress.writeMetrics(opts.metrics)
+        exit()
+    if(opts.ngrams):
+        if(opts.indir is None or opts.outfile is None):
+            print("The option --ngrams requires both --indir and --outfile to be"
+            + " specified.\nTry --help for more information.")
+            exit(2)
+        print("Preparing 1grams from %s..." % opts.indir)
+        print("")
+        prepareNgrams(opts.indir, opts.outfile, opts.jobs, opts.bufsize,
+                      opts.decompressor, progress, opts.checkpoint,
+                      opts.wordlist_format, opts.consolidate, opts.memory,
+                      opts.years, opts.tmpdir)
+        progress.summary()
+        if(opts.metrics):
+            progress.writeMetrics(opts.metrics)
+        print("")
+        print("Preparation of all 1grams is complete.")
+        exit()
+    if(opts.bnc):
+        if(opts.infile is None or opts.outfile is None):
+            print("The option --bnc requires both --infile and --outfile to be"
+            + " specified.\nTry --help for more information.")
+            exit(2)
+        print("Preparing BNC wordlist from %s..." % opts.infile)
+        print("")
+        prepareBNC(opts.infile, opts.outfile, opts.bufsize, opts.decompressor,
+                   progress, opts.wordlist_format, opts.consolidate,
+                   opts.memory, opts.tmpdir)
+        progress.summary()
+        if(opts.metrics):
+            progress.writeMetrics(opts.metrics)
+        print("")
+        print("Preparation of BNC word list is complete.")
+        exit()
+    if(opts.batch):
+        if(opts.infile is None or (opts.outfile is None and opts.database is None and opts.shards is None)):
+            print("The option --batch requires both --infile and --outfile (or"
+            + " --sqlite or --shards) to be specified.\nTry --help for more"
+            + " information.")
+            exit(2)
+        print("Processsing %s..." % opts.infile)
+        print("")
+        detectIsograms(opts.infile, opts.outfile, progress=progress,
+                       database=opts.database, table=opts.table,
+                       index=opts.index, top=opts.top, by=opts.by,
+                       min_cpm=opts.min_cpm, properties=opts.properties,
+                       years=opts.years, decades=opts.decades,
+                       shards=opts.shards, partition=opts.partition)
+        progress.summary()
+        if(opts.metrics):
+            progress.writeMetrics(opts.metrics)
+        print("")
+        print("Processing of isograms complete.")
+        exit()
+    if(select):
+        if(opts.infile is None or (opts.outfile is None and opts.database is None and opts.shards is None)):
+            print("The options --top, --min-cpm and --partitions on their own"
+            + " require both --infile and --outfile (or --sqlite or --shards)"
+            + " to be specified.\nTry --help for more information.")
+            exit(2)
+        if(opts.partitions is not None and not isShardedIsogramFile(opts.infile)):
+            print("The --infile %s is not a sharded isogram file, so --partitions"
+                  % opts.infile + " cannot be used with it.\nTry --help for more"
+                  + " information.")
+            exit(2)
+        print("Selecting isograms from %s..." % opts.infile)
+        print("")
+        selectIsograms(opts.infile, opts.outfile, opts.top, opts.by,
+                       opts.min_cpm, progress=progress, database=opts.database,
+                       table=opts.table, index=opts.index,
+                       properties=opts.properties, years=opts.years,
+                       decades=opts.decades, shards=opts.shards,
+                       partition=opts.partition, partitions=opts.partitions,
+                       jobs=opts.jobs)
+        progress.summary()
+        if(opts.metrics):
+            progress.writeMetrics(opts.metrics)
+        print("")
+        print("Selection of isograms complete.")
+        exit()
+    if(query.count(None) < len(query)):
+        if(opts.index is None):
+            print("The --query options require --index to be specified.\nTry"
+            + " --help for more information.")
+            exit(2)
+        if(not os.path.isfile(opts.index)):
+            print("The --index %s does not exist, build it with --batch or"
+                  % opts.index + " --detect first.\nTry --help for more"
+                  + " information.")
+            exit(2)
+        mask = opts.query_mask
+        if(mask is not None):
+            try:
+                mask = int(mask, 0)
+            except ValueError:
+                print("Invalid mask %s for --query-mask, use a number such as"
+                      % mask + " 7 or 0x7.\nTry --help for more information.")
+                exit(2)
+        try:
+            rows = queryIndex(opts.index, opts.query_letters, mask,
+                              opts.query_anagrams, opts.query_avoid,
+                              opts.query_isogramy, opts.query_length)
+        except sqlite3.DatabaseError as e:
+            print("Cannot read the --index %s: %s\nTry --help for more"
+                  % (opts.index, e) + " information.")
+            exit(2)
+        for row in rows:
+            print("%s\t%i\t%i\t%i" % row)
+        exit()
+    if(opts.export):
+        if(opts.infile is None or opts.outfile is None):
+            print("The option --export requires both --infile and --outfile to"
+            + " be specified.\nTry --help for more information.")
+            exit(2)
+        exportWordList(opts.infile, opts.outfile)
+        exit()
+    if(opts.isogramy):
+        print(isogram(opts.isogramy))
+        exit()
+    if(opts.stdin):
+        queryStream(sys.stdin, sys.stdout)
+        exit()
+    if(opts.serve):
+        if(os.path.exists(opts.serve) and not stat.S_ISSOCK(os.stat(opts.serve).st_mode)):
+            print("The --serve SOCKET %s exists and is not a socket.\nTry --help"
+                  % opts.serve + " for more information.")
+            exit(2)
+        print("Answering queries on %s, press Ctrl+C to stop." % opts.serve)
+        serveQueries(opts.serve)
+        exit()
+    if(count_opts == 0 and len(args) > 0):
+        print(isogram(args[0]))
+        exit()
+
+    #No options nor arguments given, refer to --help.
+    print("Ooops. Missing options or arguments. See --help for usage.")
+    exit(2)
+
+
+def test():
+    """Runs some examples to test the isogram(), tidyString() and
+    prepareNgrams() functions."""
+    #Test isogram()
+    print("Testing isogram function.")
+    time.sleep(2)
+    candidates = [
+        'abca',   # 0-isogram
+        'abcd',   # 1-isogram
+        'baba',   # 2-isogram
+        'ababab'  # 3-isogram
+    ]
+    print("Candidates:", candidates)
+    print("Results:")
+    for cand in candidates:
+        print("  ", cand, ":", isogram(cand))
+    print("\n")
+    time.sleep(1)
+
+    #Test tidyString()
+    print("Testing string tidy function.")
+    time.sleep(2)
+    candidate = 'TestBl$a\'h-foo.bar.áÉìÒüẄŷẐ_FOO_BAR'
+    print("Candidate:", candidate)
+    print("Result:", tidyString(candidate))
+    print("Cache:", tidyCacheInfo())
+    print("\n")
+    time.sleep(1)
+
+    #Test prepareNGrams()
+    print("Testing ngram extraction (this may take an hour or more).")
+    time.sleep(2)
+    try:
+        prepareNgrams("./test/testgrams", "./test/testgrams.csv", checkpoint=False)
+        print("Ngram extraction was successful.")
+    except Exception:
+        print("An error occurred:", Exception)
+    print("\n")
+    time.sleep(1)
+
+    print("All tests are complete.")
+
+
+#Relative frequencies of the letters a-z in English, for generateCorpus()
+LETTER_FREQUENCIES = [8.2, 1.5, 2.8, 4.3, 12.7, 2.2, 2.0, 6.1, 7.0, 0.2, 0.8,
+                      4.0, 2.4, 6.7, 7.5, 1.9, 0.1, 6.0, 6.3, 9.1, 2.8, 1.0,
+                      2.4, 0.2, 2.0, 0.1]
+
+#Part of speech tags of Google Ngrams version 2
+NGRAM_POS_TAGS = ["NOUN", "VERB", "ADJ", "ADV", "PRON", "DET", "ADP", "NUM",
+                  "CONJ", "PRT"]
+
+def generateCorpus(directory, words=100000, seed=1):
+    """Generate a synthetic corpus for benchmark().
+
+    Writes a Google Ngrams version 2 style 1-gram directory, with one gzipped
+    file per initial letter and a total_counts file, to directory/ngrams and a
+    BNC style frequency list to directory/all.al.gz. The vocabulary of the
+    given number of words has English letter frequencies and includes plain
+    isograms, capitalised and accented forms, words with digits and POS tagged
+    variants, each with between 1 and 60 rows of yearly counts.
+
+    Returns a tuple of the ngram directory and the BNC file.
+
+    Keyword arguments:
+    directory -- the directory to write to, which must exist
+    words -- number of distinct words to generate (default 100000)
+    seed -- seed for the random number generator (default 1)
+    """
+    rng = random.Random(seed)
+    letters = [chr(97 + k) for k in range(26)]
+    accents = {"a": "\u00e0\u00e1\u00e2\u00e4", "e": "\u00e8\u00e9\u00ea\u00eb",
+               "i": "\u00ed\u00ef", "o": "\u00f3\u00f4\u00f6", "u": "\u00fa\u00fc",
+               "c": "\u00e7", "n": "\u00f1"}
+    vocabulary = set()
+    while len(vocabulary) < words:
+        length = min(max(int(rng.lognormvariate(1.8, 0.45)), 1), 20)
+        kind = rng.random()
+        if kind < 0.3 and length <= 26: #A plain isogram
+            word = "".join(rng.sample(letters, length))
+        else:
+            word = "".join(rng.choices(letters, LETTER_FREQUENCIES, k=length))
+        if kind > 0.97: #Accented
+            word = "".join([rng.choice(accents[c]) if c in accents and rng.random() < 0.5 else c for c in word])
+        elif kind > 0.95: #With digits
+            word += str(rng.randint(0, 99))
+        if rng.random() < 0.1:
+            word = word.capitalize()
+        vocabulary.add(word)
+    vocabulary = sorted(vocabulary)
+    #Google Ngrams, one file per initial letter
+    ngrams = os.path.join(directory, "ngrams")
+    if not os.path.isdir(ngrams):
+        os.makedirs(ngrams)
+    shards = {}
+    for word in vocabulary:
+        forms = [word] + [word + "_" + tag for tag in rng.sample(NGRAM_POS_TAGS, rng.randint(0, 3))]
+        initial = tidyString(word)[:1]
+        shards.setdefault(initial if initial.isalpha() else "other", []).extend(forms)
+    totals = {}
+    for (initial, forms) in shards.items():
+        outfh = gzip.open(os.path.join(ngrams, "googlebooks-eng-all-1gram-20120701-%s.gz" % initial), "wb", compresslevel=6)
+        lines = []
+        for form in sorted(forms):
+            first = rng.randint(1800, 2008)
+            for year in range(first, min(first + rng.randint(1, 60), 2009)):
+                count = int(rng.paretovariate(1.2))
+                volumes = rng.randint(1, count)
+                lines.append("%s\t%i\t%i\t%i\n" % (form, year, count, volumes))
+                total = totals.setdefault(year, [0, 0, 0])
+                total[0] += count
+                total[1] += volumes
+                total[2] += volumes
+            if len(lines) > 100000:
+                outfh.write("".join(lines).encode("utf8"))
+                lines = []
+        outfh.write("".join(lines).encode("utf8"))
+        outfh.close()
+    outfh = open(os.path.join(ngrams, "googlebooks-eng-all-totalcounts-20120701.txt"), "w")
+    outfh.write(" " + "\t".join(["%i,%i,%i,%i" % (year, total[0], total[1], total[2]) for (year, total) in sorted(totals.items())]) + "\t")
+    outfh.close()
+    #BNC frequency list, sorted by word
+    bnc = os.path.join(directory, "all.al.gz")
+    outfh = gzip.open(bnc, "wb", compresslevel=6)
+    lines = []
+    total_count = 0
+    for word in vocabulary:
+        for pos in rng.sample(["nn1", "vvb", "jj", "av0", "nn2", "vvd"], rng.randint(1, 3)):
+            count = int(rng.paretovariate(1.1))
+            total_count += count
+            lines.append("%i %s %s %i\n" % (count, word.lower(), pos, rng.randint(1, min(count, 4124))))
+    outfh.write(("%i !!WHOLE_CORPUS !!ANY 4124\n" % total_count).encode("utf8"))
+    outfh.write("".join(lines).encode("utf8"))
+    outfh.close()
+    return (ngrams, bnc)
+
+def benchmark(outfile=None, words=100000, directory=None):
+    """Time the main steps of the pipeline on a synthetic corpus.
+
+    A corpus is generated with generateCorpus() and tidyString(), isogram(),
+    classifyBatch(), prepareNgrams(), prepareBNC() and detectIsograms() are run
+    on it one after another, each in a fresh process. The time taken, items
+    and bytes processed per second and peak resident memory of each step are
+    printed and, if outfile is given, written to it as JSON.
+
+    Keyword arguments:
+    outfile -- path of a JSON file for the results (optional)
+    words -- number of distinct words in the corpus (default 100000)
+    directory -- directory for the corpus and intermediate files, which is
+                 kept; defaults to a temporary directory which is removed
+    """
+    tmpdir = None
+    if directory is None:
+        directory = tmpdir = tempfile.mkdtemp(prefix="isograms-benchmark.")
+    elif not os.path.isdir(directory):
+        os.makedirs(directory)
+    try:
+        sys.stdout.write("Generating a corpus of %i words in %s...\n" % (words, directory))
+        started = time.time()
+        (ngrams, bnc) = generateCorpus(directory, words)
+        sys.stdout.write("Generated corpus in %.1fs.\n" % (time.time() - started))
+        prepared = os.path.join(directory, "ngrams.csv")
+        steps = [("tidyString", (ngrams,)),
+                 ("isogram", (prepared,)),
+                 ("classifyBatch", (prepared,)),
+                 ("prepareNgrams", (ngrams, prepared)),
+                 ("prepareBNC", (bnc, os.path.join(directory, "bnc.csv"))),
+                 ("detectIsograms", (prepared, os.path.join(directory, "ngrams-isograms.csv")))]
+        #The word lists for isogram() and classifyBatch() come from prepareNgrams()
+        order = [3, 0, 1, 2, 4, 5]
+        results = [None] * len(steps)
+        for k in order:
+            #A fresh process for each step, so peak memory is per step
+            pool = multiprocessing.Pool(1, maxtasksperchild=1)
+            try:
+                results[k] = pool.apply(benchmarkStep, (steps[k][0],) + steps[k][1])
+            finally:
+                pool.close()
+                pool.join()
+        sys.stdout.write("%-16s %10s %12s %12s %10s %12s\n" % ("step", "seconds", "items", "items/s", "MB/s", "peak RSS MB"))
+        for result in results:
+            sys.stdout.write("%-16s %10.2f %12i %12.0f %10.1f %12s\n" % (
+                result["step"], result["seconds"], result["items"],
+                result["items_per_sec"], result["bytes_per_sec"] / 1048576.0,
+                "-" if result["peak_rss"] is None else "%.1f" % (result["peak_rss"] / 1048576.0)))
+        if outfile is not None:
+            outfh = codecs.open(outfile, "w", "utf8")
+            json.dump({"words": words, "python": sys.version.split()[0],
+                       "numpy": numpy.__version__ if numpy is not None else None,
+                       "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                       "steps": results}, outfh, indent=1)
+            outfh.close()
+            sys.stdout.write("Results written to %s\n" % outfile)
+    finally:
+        if tmpdir is not None:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+
+def benchmarkStep(step, infile, outfile=None):
+    """Run and time a single step of benchmark() and return its results.
+
+    Keyword arguments:
+    step -- name of the function to time
+    infile -- the input file or directory of the step
+    outfile -- the output file of the step, if it has one
+    """
+    #Keep the steps' own messages out of the results
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, "w")
+    progress = Progress(quiet=True)
+    try:
+        if step == "tidyString":
+            words = []
+            for infile_name in sorted(os.listdir(infile)):
+                if infile_name.endswith(".gz"):
+                    for block in readGzipBlocks(os.path.join(infile, infile_name), decompressor="python"):
+                        words.extend([str(line.split(b"\t", 1)[0], encoding="utf8") for line in block])
+            #tidyString() is called once per ngram, not once per year
+            words = list(dict.fromkeys(words))
+            size = sum([len(word) for word in words])
+            started = time.time()
+            for word in words:
+                tidyString(word)
+            items = len(words)
+        elif step in ("isogram", "classifyBatch"):
+            words = [item[0] for chunk in readWordList(infile) for item in chunk]
+            size = sum([len(word) for word in words])
+            started = time.time()
+            if step == "isogram":
+                for word in words:
+                    isogram(word)
+            else:
+                for k in range(0, len(words), 100000):
+                    classifyBatch(words[k:k + 100000])
+            items = len(words)
+        else:
+            size = os.path.getsize(infile) if os.path.isfile(infile) else sum(
+                [os.path.getsize(os.path.join(infile, name)) for name in os.listdir(infile)])
+            started = time.time()
+            if step == "prepareNgrams":
+                prepareNgrams(infile, outfile, progress=progress, checkpoint=False)
+            elif step == "prepareBNC":
+                prepareBNC(infile, outfile, progress=progress)
+            elif step == "detectIsograms":
+                detectIsograms(infile, outfile, progress=progress)
+            items = progress.stages[0][2]
+        seconds = time.time() - started
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+    try:
+        import resource
+        peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        #ru_maxrss is in bytes on macOS, but in kilobytes elsewhere
+        if sys.platform != "darwin":
+            peak_rss *= 1024
+    except ImportError: #Not available on Windows
+        peak_rss = None
+    return {"step": step, "seconds": seconds, "items": items, "bytes": size,
+            "items_per_sec": items / max(seconds, 1e-9),
+            "bytes_per_sec": size / max(seconds, 1e-9), "peak_rss": peak_rss}
+
+
+def prepareNgrams(directory, outfile, jobs=1, bufsize=None, decompressor="auto",
+                  progress=None, checkpoint=False, wordlist_format="tsv",
+                  consolidate=False, memory=None, years=None, tmpdir=None):
+    """Extract strings from Google Ngrams and prepare them for running isogram()
+    on them.
+
+    The function extracts all entries from all the ngram files in the given
+    directory and compacts them, so that there is only one entry per ngram. The
+    output file then contains one line for each ngram, with the original ngram,
+    a tidied version (run through tidyString()), the combined match_count and
+    the combined volume_count, all separated by a single tabstop.
+
+    Each ngram file is first prepared into a sorted partial file of its own,
+    either one after another or, if jobs is greater than 1, in a pool of worker
+    processes. The partial files are then merged into outfile, combining any
+    entries for the same ngram. The output is therefore sorted by ngram and is
+    identical regardless of the number of jobs. If consolidate is True, the
+    entries are further combined into one per tidied word across all files,
+    see consolidateItems(), and the output is sorted by tidied word.
+
+    If checkpoint is True, the partial files are kept in a directory named
+    outfile.parts, and a manifest named outfile.checkpoint records the size,
+    modification time and SHA-256 hash of each ngram file that has been
+    prepared, along with the number and range of ngrams in its partial file.
+    The manifest is updated as soon as each file is done, so if the function
+    is run again, e.g. after it was interrupted or new files were added to
+    the directory, only new or modified files are prepared again. Otherwise
+    the partial files are written to a temporary directory in tmpdir, or the
+    system's default temporary directory, which is removed at the end.
+
+    If the total_counts file from the Google Ngrams corpus is found in the
+    directory, a second file of the name outfile.totals is written which
+    includes the cumulative total of the match and volume counts. This data can
+    later be used to calculate relative frequencies, and the function
+    detectIsograms() automatically looks for this file.
+
+    If years is given, the per-year match counts of each ngram, which are
+    otherwise summed up, are kept as well and written to a sparse year by
+    ngram matrix of that name, with the per-year totals from the total_counts
+    file in years.totals, see YearMatrixWriter. This is done in the same pass
+    over the ngram files, and detectIsograms() can then compute per-decade
+    frequencies of the isograms from it.
+
+    The function has been written to run on the 1-gram files from Google Ngrams
+    version 2, http://storage.googleapis.com/books/ngrams/books/datasetsv2.html.
+
+    Keyword arguments:
+    directory -- The path of the directory where all the ngram files are located
+    outfile -- path to the file the output should be written to
+    jobs -- number of ngram files to prepare in parallel (default 1)
+    bufsize -- decompression buffer size in bytes, see readGzipBlocks()
+    decompressor -- how to decompress the files, see readGzipBlocks()
+    progress -- the Progress used to report on each file (optional)
+    checkpoint -- whether to keep partial files and a manifest for reuse by
+                  later runs (default False)
+    wordlist_format -- format of outfile, see openWordList() (default "tsv")
+    consolidate -- whether to consolidate entries by tidied word (default False)
+    memory -- memory limit for consolidating, see consolidateItems()
+    years -- path of a year matrix to write (optional)
+    tmpdir -- directory for temporary files (default the system default)
+    """
+    if progress is None:
+        progress = Progress()
+    #Remove trailing slashes from directory path
+    directory = directory.rstrip("\\/")
+    sys.stdout.write("Reading directory: "+directory+"\n")
+    sys.stdout.write("Writing to: "+outfile+"\n")
+    (shards, totals) = listNgramFiles(directory)
+    if totals is not None:
+        writeWordListTotals(outfile, totals)
+    outfh = openWordList(outfile, wordlist_format)
+    items = readNgrams(directory, shards, outfile, jobs, bufsize, decompressor,
+                       progress, checkpoint, years, tmpdir)
+    if consolidate:
+        items = consolidateItems(items, memory, tmpdir, progress)
+    for item in items:
+        outfh.write(item)
+    outfh.close()
+    sys.stdout.write("Finished processing all files in directory.\n")
+
+def listNgramFiles(directory):
+    """List the 1-gram files in a Google Ngrams directory and read its
+    total_counts file, if there is one.
+
+    Returns a tuple of the sorted list of 1-gram file names and a dict with
+    the "total_1grams" and "total_volumes", or None if there is no
+    total_counts file. The listing is sorted so that the order of the files
+    does not depend on the filesystem; note that the total_counts file is
+    always read first, even though it sorts after the 1-gram files.
+
+    Keyword arguments:
+    directory -- the path of the directory
+    """
+    shards = []
+    totals = None
+    for infile in sorted(os.listdir(directory)):
+        if(fnmatch.fnmatch(infile, "*.gz")): #A 1-gram file
+            shards.append(infile)
+        elif(fnmatch.fnmatch(infile, "*totalcounts*.txt")): #The total_counts file
+            sys.stdout.write("Reading total_counts file: "+infile+"\n")
+            (total_1grams, total_volumes) = readTotalCounts(directory+"/"+infile)
+            sys.stdout.write("Counted %i 1-grams and %i volumes.\n" % (total_1grams, total_volumes))
+            totals = {"total_1grams": total_1grams, "total_volumes": total_volumes}
+    return (shards, totals)
+
+def writeWordListTotals(outfile, totals):
+    """Write the totals of a word list to outfile.totals.
+
+    Keyword arguments:
+    outfile -- path of the word list
+    totals -- dict with the "total_1grams" and "total_volumes"
+    """
+    sys.stdout.write("Writing totals to file: %s\n" % (outfile+".totals"))
+    totfh = codecs.open(outfile+".totals", "w", "utf8")
+    totfh.write("!total\t!any\t%i\t%i\n" % (totals["total_1grams"], totals["total_volumes"]))
+    totfh.close()
+
+def readNgrams(directory, shards, workfile, jobs=1, bufsize=None,
+               decompressor="auto", progress=None, checkpoint=False,
+               years=None, tmpdir=None):
+    """Generator yielding one (tidied, ngram, match_count, volume_count) item
+    per ngram from the given 1-gram files, sorted by ngram.
+
+    This does the work of prepareNgrams(), which describes how the files are
+    prepared into partial files and merged, and is also used to feed
+    detectNgrams() directly.
+
+    Keyword arguments:
+    directory -- the path of the directory with the 1-gram files
+    shards -- list of 1-gram file names, see listNgramFiles()
+    workfile -- path the partial files and checkpoint are named after
+    jobs -- number of ngram files to prepare in parallel (default 1)
+    bufsize -- decompression buffer size in bytes, see readGzipBlocks()
+    decompressor -- how to decompress the files, see readGzipBlocks()
+    progress -- the Progress used to report on each file (optional)
+    checkpoint -- whether to keep partial files and a manifest for reuse by
+                  later runs (default False)
+    years -- path of a year matrix to write as the ngrams are merged
+             (optional), see prepareNgrams()
+    tmpdir -- directory for the partial files without checkpoint (default the
+              system default)
+    """
+    if progress is None:
+        progress = Progress()
+    #Prepare each shard into a sorted partial file, next to the workfile if
+    #checkpointing, skipping those with an up to date partial file from an earlier run
+    if checkpoint:
+        partdir = workfile + ".parts"
+        if not os.path.isdir(partdir):
+            os.makedirs(partdir)
+        manifest = readCheckpoint(workfile + ".checkpoint")
+    else:
+        partdir = tempfile.mkdtemp(prefix=os.path.basename(workfile)+".parts.",
+                                   dir=tmpdir)
+        manifest = {}
+    finished = {}
+    pending = []
+    for infile in shards:
+        partfile = os.path.join(partdir, infile + ".part")
+        entry = manifest.get(infile)
+        #Partial files without the per-year counts are no use for the matrix
+        if(entry is not None and os.path.exists(partfile)
+           and (years is None or entry.get("years"))
+           and isShardUnchanged(directory+"/"+infile, entry)):
+            sys.stdout.write("Skipping unchanged file: "+infile+"\n")
+            finished[infile] = entry
+        else:
+            pending.append((directory+"/"+infile, partfile))
+    #Worker processes report on separate lines and profile themselves
+    parallel = jobs > 1 and len(pending) > 1
+    tasks = [(infile, partfile, bufsize, decompressor,
+              progress.arguments(not parallel, parallel), years is not None)
+             for (infile, partfile) in pending]
+    if checkpoint:
+        #Forget about shards that were removed or have to be prepared again
+        writeCheckpoint(workfile + ".checkpoint", directory, finished)
+        for partfile in os.listdir(partdir):
+            if partfile[:-len(".part")] not in finished:
+                os.remove(os.path.join(partdir, partfile))
+    try:
+        progress.startStage("prepare")
+        if parallel:
+            sys.stdout.write("Preparing %i files with %i jobs.\n" % (len(tasks), jobs))
+            pool = multiprocessing.Pool(min(jobs, len(tasks)))
+            try:
+                for (infile, entry, lines, size, counters, statsfile) in pool.imap_unordered(prepareNgramShard, tasks):
+                    progress.addToStage(lines, size)
+                    progress.addCounters(counters)
+                    if statsfile is not None:
+                        progress.addProfile(statsfile)
+                    finished[os.path.basename(infile)] = entry
+                    if checkpoint:
+                        writeCheckpoint(workfile + ".checkpoint", directory, finished)
+                    sys.stdout.write("Finished processing file: %s (%i ngrams)\n" % (os.path.basename(infile), entry["ngrams"]))
+                pool.close()
+            except:
+                pool.terminate()
+                raise
+            finally:
+                pool.join()
+        else:
+            for task in tasks:
+                sys.stdout.write("Reading file: "+os.path.basename(task[0])+"\n")
+                (infile, entry, lines, size, counters, statsfile) = prepareNgramShard(task)
+                progress.addToStage(lines, size)
+                progress.addCounters(counters)
+                finished[os.path.basename(infile)] = entry
+                if checkpoint:
+                    writeCheckpoint(workfile + ".checkpoint", directory, finished)
+                sys.stdout.write("Finished processing file. (%i ngrams)\n" % entry["ngrams"])
+        progress.endStage()
+        partfiles = [os.path.join(partdir, infile + ".part") for infile in shards]
+        sys.stdout.write("Merging %i partial files.\n" % len(partfiles))
+        matrix = None
+        if years is not None:
+            sys.stdout.write("Writing per-year counts to: %s\n" % years)
+            matrix = YearMatrixWriter(years, readYearTotals(directory))
+        progress.startStage("merge")
+        progress.startTask(os.path.basename(workfile))
+        n = 0
+        for item in mergeNgramParts(partfiles):
+            if matrix is not None:
+                matrix.write(item)
+            yield item[:4]
+            n += 1
+            if(n == 65536):
+                progress.update(n)
+                n = 0
+        progress.update(n)
+        progress.endTask()
+        progress.endStage()
+        if matrix is not None:
+            matrix.close()
+    finally:
+        if not checkpoint:
+            shutil.rmtree(partdir, ignore_errors=True)
+
+def streamNgrams(directory, shards, bufsize=None, decompressor="auto",
+                 progress=None, years=None):
+    """Generator yielding one (tidied, ngram, match_count, volume_count) item
+    per ngram from the given 1-gram files, one file after another, as they are
+    read.
+
+    This is how detectNgrams() reads the files unless it has to go through
+    readNgrams(). Nothing is written to disk apart from the year matrix, but
+    the items are in the order of the files rather than sorted by ngram, and
+    the entries of an ngram are only combined within a file, which is all the
+    Google Ngrams files need, as each covers different ngrams.
+
+    Keyword arguments:
+    directory -- the path of the directory with the 1-gram files
+    shards -- list of 1-gram file names, see listNgramFiles()
+    bufsize -- decompression buffer size in bytes, see readGzipBlocks()
+    decompressor -- how to decompress the files, see readGzipBlocks()
+    progress -- the Progress used to report on each file (optional)
+    years -- path of a year matrix to write as the ngrams are read (optional),
+             see prepareNgrams()
+    """
+    if progress is None:
+        progress = Progress()
+    matrix = None
+    if years is not None:
+        sys.stdout.write("Writing per-year counts to: %s\n" % years)
+        matrix = YearMatrixWriter(years, readYearTotals(directory))
+    progress.startStage("prepare")
+    for infile in shards:
+        sys.stdout.write("Reading file: "+infile+"\n")
+        progress.startTask(infile, os.path.getsize(directory+"/"+infile))
+        ngrams = 0
+        for item in readNgramShard(directory+"/"+infile, bufsize, decompressor,
+                                   progress, years is not None):
+            if matrix is not None:
+                matrix.write(item)
+            yield item[:4]
+            ngrams += 1
+        progress.endTask()
+        sys.stdout.write("Finished processing file. (%i ngrams)\n" % ngrams)
+    progress.endStage()
+    if matrix is not None:
+        matrix.close()
+
+def classifyNgrams(directory, shards, writers, totals, jobs, chunksize=100000,
+                   bufsize=None, decompressor="auto", progress=None,
+                   properties=None):
+    """Classify the ngrams of the given 1-gram files in a pool of jobs worker
+    processes, one file per task (see detectNgramShard()), and write the
+    isograms among them to each of the writers, in the order of the files.
+
+    Returns a dict of counts as classifyWordList() does. Only the isograms of
+    the files that are done but not yet written are held in memory.
+
+    Keyword arguments:
+    directory -- the path of the directory with the 1-gram files
+    shards -- list of 1-gram file names, see listNgramFiles()
+    writers -- list of writers, see openIsogramWriters()
+    totals -- dict with the "total_1grams" and "total_volumes"
+    jobs -- number of files to classify in parallel
+    chunksize -- see detectIsograms()
+    bufsize, decompressor -- see readNgramShard()
+    progress -- the Progress used to report on each file (optional)
+    properties -- list of property names to classify (default
+                  DEFAULT_PROPERTIES)
+    """
+    if progress is None:
+        progress = Progress()
+    names = [entry[2] for entry in wordProperties(properties)]
+    counts = {"total_words": 0, "total_isograms": 0}
+    for name in names:
+        counts[name] = 0
+    #Worker processes report on separate lines and profile themselves
+    tasks = [(directory+"/"+infile, bufsize, decompressor,
+              progress.arguments(False, True), totals, chunksize, properties)
+             for infile in shards]
+    sys.stdout.write("Reading %i files with %i jobs.\n" % (len(tasks), jobs))
+    progress.startStage("prepare")
+    pool = multiprocessing.Pool(min(jobs, len(tasks)))
+    try:
+        for (infile, rows, found, lines, size, counters, stages, statsfile) in pool.imap(detectNgramShard, tasks):
+            progress.addToStage(lines, size)
+            progress.addCounters(counters)
+            if statsfile is not None:
+                progress.addProfile(statsfile)
+            for (name, seconds, stage_lines, stage_size) in stages:
+                progress.addStageTime(name, seconds, stage_lines, concurrent=True)
+            started = time.time()
+            for writer in writers:
+                writer.write(rows)
+            progress.addStageTime("write", time.time() - started, len(rows))
+            for (name, value) in found.items():
+                counts[name] += value
+            sys.stdout.write("Finished processing file: %s (%i isograms)\n" % (os.path.basename(infile), len(rows)))
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+    progress.endStage()
+    return counts
+
+def detectNgramShard(task):
+    """Classify the ngrams of a single 1-gram file, for classifyNgrams() in a
+    worker process.
+
+    Returns a tuple of the input file, the rows of its isograms (see
+    classifyItems()), the counts from classifyWordList(), the number of lines
+    and bytes read, the counters (see Progress.count()), the time spent
+    classifying as a list of stages (see Progress.stageTotals()) and the file
+    with the profile of this task if it was profiled, or None.
+
+    Keyword arguments:
+    task -- tuple of (infile, bufsize, decompressor, progress, totals,
+            chunksize, properties), where progress is a tuple of arguments to
+            Progress()
+    """
+    (infile, bufsize, decompressor, progress, totals, chunksize, properties) = task
+    progress = Progress(*progress)
+    profiler = None
+    if progress.profile is not None:
+        profiler = cProfile.Profile()
+        profiler.enable()
+    progress.startTask(os.path.basename(infile), os.path.getsize(infile))
+    collector = IsogramRowList()
+    items = readNgramShard(infile, bufsize, decompressor, progress)
+    counts = classifyWordList(chunkItems(items, chunksize), totals,
+                              [collector], properties=properties,
+                              stages=progress)
+    (lines, size) = progress.endTask()
+    statsfile = None
+    if profiler is not None:
+        profiler.disable()
+        (fd, statsfile) = tempfile.mkstemp(prefix="isograms-", suffix=".pstats")
+        os.close(fd)
+        profiler.dump_stats(statsfile)
+    #Writing to the collector is not worth reporting
+    stages = [stage for stage in progress.stageTotals() if stage[0] == "detect"]
+    return (infile, collector.rows, counts, lines, size, progress.counters,
+            stages, statsfile)
+
+#Default memory limit for consolidateItems(), in bytes
+CONSOLIDATE_MEMORY = 1024 * 1024 * 1024
+
+def consolidateItems(items, memory=None, tmpdir=None, progress=None):
+    """Generator consolidating word list items by their tidied word, yielding
+    one (tidied, original, match_count, volume_count) item per tidied word,
+    sorted by tidied word.
+
+    prepareNgrams() and prepareBNC() only combine consecutive entries, so the
+    same tidied word still turns up once per part of speech, spelling variant
+    or ngram file. Here the counts of all items with the same tidied word are
+    added up, and the original of the item with the highest match_count (the
+    first in sorted order on a tie) is kept.
+
+    Items are combined in memory until they take up about memory bytes, then
+    written out as a sorted run to a temporary file; the runs are merged at
+    the end, so any number of items can be consolidated with bounded memory.
+
+    Keyword arguments:
+    items -- iterable of (tidied, original, match_count, volume_count) items
+    memory -- approximate memory limit in bytes (default CONSOLIDATE_MEMORY)
+    tmpdir -- directory for the temporary runs (default the system default)
+    progress -- a Progress to count the items, words and runs on (optional)
+    """
+    if progress is None:
+        progress = Progress(quiet=True)
+    if memory is None:
+        memory = CONSOLIDATE_MEMORY
+    runs = []
+    words = {}
+    used = 0
+    consolidated = 0
+    try:
+        for (consolidated, item) in enumerate(items, 1):
+            tidy = item[0]
+            match_count = int(item[2])
+            entry = words.get(tidy)
+            if entry is None:
+                words[tidy] = [item[1], match_count, match_count, int(item[3])]
+                #Rough size of the dict slot, list, strings and ints
+                used += 300 + len(tidy) + len(item[1])
+                if(used > memory):
+                    runs.append(writeConsolidatedRun(words, tmpdir))
+                    words = {}
+                    used = 0
+                continue
+            if(match_count > entry[1] or (match_count == entry[1] and item[1] < entry[0])):
+                entry[0] = item[1]
+                entry[1] = match_count
+            entry[2] += match_count
+            entry[3] += int(item[3])
+        progress.count("consolidate", "items", consolidated)
+        consolidated = 0
+        if not runs:
+            progress.count("consolidate", "words", len(words))
+            for tidy in sorted(words):
+                entry = words[tidy]
+                yield (tidy, entry[0], entry[2], entry[3])
+            return
+        runs.append(writeConsolidatedRun(words, tmpdir))
+        progress.count("consolidate", "runs", len(runs))
+        words = None
+        current = None
+        for item in heapq.merge(*[readConsolidatedRun(run) for run in runs]):
+            if current is not None and item[0] == current[0]:
+                if(item[2] > current[2] or (item[2] == current[2] and item[1] < current[1])):
+                    current[1] = item[1]
+                    current[2] = item[2]
+                current[3] += item[3]
+                current[4] += item[4]
+                continue
+            if current is not None:
+                consolidated += 1
+                yield (current[0], current[1], current[3], current[4])
+            current = list(item)
+        if current is not None:
+            consolidated += 1
+            yield (current[0], current[1], current[3], current[4])
+        progress.count("consolidate", "words", consolidated)
+    finally:
+        for run in runs:
+            if os.path.exists(run):
+                os.remove(run)
+
+def writeConsolidatedRun(words, tmpdir=None):
+    """Write the entries collected by consolidateItems() to a temporary file,
+    sorted by tidied word, and return its path."""
+    (fd, run) = tempfile.mkstemp(prefix="isograms-run.", suffix=".tsv", dir=tmpdir)
+    outfh = codecs.getwriter("utf8")(os.fdopen(fd, "wb"))
+    for tidy in sorted(words):
+        entry = words[tidy]
+        outfh.write("%s\t%s\t%i\t%i\t%i\n" % (tidy, entry[0], entry[1], entry[2], entry[3]))
+    outfh.close()
+    return run
+
+def readConsolidatedRun(run):
+    """Generator yielding (tidied, original, original_count, match_count,
+    volume_count) tuples from a file written by writeConsolidatedRun()."""
+    infh = open(run, "r", encoding="utf8", newline="\n")
+    for line in infh:
+        item = line.rstrip("\n").split("\t")
+        yield (item[0], item[1], int(item[2]), int(item[3]), int(item[4]))
+    infh.close()
+
+def readGzipBlocks(infile, bufsize=None, decompressor="auto", progress=None):
+    """Generator yielding the lines of a gzipped file as lists of bytes, one
+    list for each block of decompressed data.
+
+    The file is decompressed bufsize bytes at a time, either in this process or
+    by an external program writing to a pipe, which lets decompression run in
+    parallel with whatever is done with the lines. Line endings are removed and
+    empty lines are skipped. An IOError is raised if the program is not found,
+    or if it exits with an error after all of its output has been read; if
+    the generator is closed early, the program's exit status is ignored.
+
+    Keyword arguments:
+    infile -- path to the gzipped file
+    bufsize -- number of bytes to decompress at a time (default GZIP_BUFFER_SIZE)
+    decompressor -- "python" to decompress in this process, the name of a
+                    program which accepts -dc (e.g. "pigz" or "zcat"), or
+                    "auto" to use pigz if it is installed (default "auto")
+    progress -- a Progress to report the lines and compressed bytes read to
+                after each block (optional)
+    """
+    if bufsize is None:
+        bufsize = GZIP_BUFFER_SIZE
+    if decompressor == "auto":
+        decompressor = "pigz" if shutil.which("pigz") else "python"
+    elif decompressor != "python" and shutil.which(decompressor) is None:
+        raise IOError("Cannot find the decompressor %s to read %s" % (decompressor, infile))
+    proc = None
+    #The compressed file is opened here even for an external program, which
+    #reads it from stdin; it then shares the file offset, so the position of
+    #rawfh always tells how much of the compressed input has been consumed
+    rawfh = open(infile, "rb", buffering=0)
+    if decompressor == "python":
+        infh = gzip.GzipFile(fileobj=rawfh, mode="rb")
+    else:
+        proc = subprocess.Popen([decompressor, "-dc"], stdin=rawfh,
+                                stdout=subprocess.PIPE, bufsize=bufsize)
+        infh = proc.stdout
+    finished = False
+    try:
+        rest = b""
+        while True:
+            data = infh.read(bufsize)
+            if not data:
+                break
+            lines = (rest + data).split(b"\n")
+            rest = lines.pop()
+            if progress is not None:
+                progress.update(len(lines), rawfh.tell())
+            yield [line.rstrip(b"\r") for line in lines if line]
+        if rest:
+            if progress is not None:
+                progress.update(1, rawfh.tell())
+            yield [rest.rstrip(b"\r")]
+        finished = True
+    finally:
+        infh.close()
+        rawfh.close()
+        #If the lines were not read to the end, the program fails writing to
+        #the closed pipe, and any error on the way out is the one to report
+        if proc is not None:
+            if proc.wait() != 0 and finished:
+                raise IOError("%s exited with status %i while reading %s" % (decompressor, proc.returncode, infile))
+
+def readTotalCounts(infile):
+    """Returns the summed (match_count, volume_count) of a total_counts file.
+
+    Keyword arguments:
+    infile -- path to the total_counts file from Google Ngrams
+    """
+    total_1grams = 0
+    total_volumes = 0
+    for (year, match_count, volume_count) in readYearCounts(infile):
+        total_1grams += match_count
+        total_volumes += volume_count
+    return (total_1grams, total_volumes)
+
+def readYearCounts(infile):
+    """Returns a list of (year, match_count, volume_count) tuples from a
+    total_counts file.
+
+    Keyword arguments:
+    infile -- path to the total_counts file from Google Ngrams
+    """
+    infh = open(infile)
+    counts = infh.read()
+    infh.close()
+    counts = counts.split("\t")
+    years = []
+    for year in counts:
+        year = year.split(",")
+        if(len(year) < 4): #Skip fields that are empty (e.g. first and last)
+            pass
+        else:
+            years.append((int(year[0]), int(year[1]), int(year[3])))
+    return years
+
+def readYearTotals(directory):
+    """Returns the per-year totals from the total_counts file in a Google
+    Ngrams directory (see readYearCounts()), or an empty list if there is none.
+
+    Keyword arguments:
+    directory -- the path of the directory
+    """
+    for infile in sorted(os.listdir(directory)):
+        if(fnmatch.fnmatch(infile, "*totalcounts*.txt")):
+            return readYearCounts(directory+"/"+infile)
+    return []
+
+def readNgramShard(infile, bufsize=None, decompressor="auto", progress=None,
+                   years=False):
+    """Generator yielding one [tidied, ngram, match_count, volume_count] entry
+    for each ngram in a gzipped Google Ngrams 1-gram file.
+
+    The per-year rows of each ngram are summed up, and ngrams whose tidied form
+    contains anything but letters are skipped. The rows are split and summed up
+    as bytes, so only the ngram itself is decoded, once per ngram. If years is
+    True, each entry has a fifth element with the per-year match counts as
+    space separated "year:match_count" pairs.
+
+    Keyword arguments:
+    infile -- path to the 1-gram file
+    bufsize -- decompression buffer size in bytes, see readGzipBlocks()
+    decompressor -- how to decompress the file, see readGzipBlocks()
+    progress -- a Progress to report the lines read to (optional)
+    years -- whether to keep the per-year match counts (default False)
+    """
+    current_headword = None
+    match_count = 0
+    volume_count = 0
+    counts = []
+    ngrams = 0
+    rejected = 0
+    for block in readGzipBlocks(infile, bufsize, decompressor, progress):
+        for line in block:
+            fields = line.split(b"\t")
+            #Still on the same ngram, so add match_count and volume_count
+            if fields[0] == current_headword:
+                match_count += int(fields[2])
+                volume_count += int(fields[3])
+                if years:
+                    counts.append(fields[1] + b":" + fields[2])
+                continue
+            #New ngram. Save current ngram and move on to new ngram.
+            if current_headword != None:
+                ngram = str(current_headword, encoding="utf8")
+                tidy = tidyString(ngram)
+                ngrams += 1
+                #Skip ngrams containing numbers...
+                if( tidy.isalpha() ):
+                    if years:
+                        yield [tidy, ngram, match_count, volume_count, str(b" ".join(counts), encoding="ascii")]
+                    else:
+                        yield [tidy, ngram, match_count, volume_count]
+                else:
+                    rejected += 1
+            #First or new ngram
+            current_headword = fields[0]
+            match_count = int(fields[2])
+            volume_count = int(fields[3])
+            if years:
+                counts = [fields[1] + b":" + fields[2]]
+    #Save the last ngram of the file
+    if current_headword != None:
+        ngram = str(current_headword, encoding="utf8")
+        tidy = tidyString(ngram)
+        ngrams += 1
+        if( tidy.isalpha() ):
+            if years:
+                yield [tidy, ngram, match_count, volume_count, str(b" ".join(counts), encoding="ascii")]
+            else:
+                yield [tidy, ngram, match_count, volume_count]
+        else:
+            rejected += 1
+    if progress is not None:
+        progress.count("prepare", "ngrams_aggregated", ngrams)
+        progress.count("prepare", "rejected_not_alpha", rejected)
+
+#Approximate memory limit in bytes for sorting a 1-gram file that is not
+#already in order in prepareNgramShard()
+SHARD_MEMORY = 256 * 1024 * 1024
+
+def prepareNgramShard(task):
+    """Prepare a single 1-gram file into a partial file sorted by ngram.
+
+    Used by prepareNgrams() for each file, possibly in a worker process. The
+    entries are written out as they are read for as long as they are in order,
+    which the 1-gram files normally are. Should an entry come out of order,
+    the rest are sorted in runs of about SHARD_MEMORY bytes, which are written
+    to temporary files next to the partial file and merged with what was
+    written before, so memory use stays bounded either way. Returns
+    a tuple of the input file, its checkpoint entry (see readCheckpoint()), the
+    number of lines and bytes read, the counters (see Progress.count()) and
+    the file with the profile of this task if it was profiled, or None.
+
+    Keyword arguments:
+    task -- tuple of (infile, partfile, bufsize, decompressor, progress, years),
+            where progress is a tuple of arguments to Progress() and years
+            whether to keep the per-year counts, see readNgramShard()
+    """
+    (infile, partfile, bufsize, decompressor, progress, years) = task
+    stat = os.stat(infile)
+    progress = Progress(*progress)
+    profiler = None
+    if progress.profile is not None:
+        profiler = cProfile.Profile()
+        profiler.enable()
+    progress.startTask(os.path.basename(infile), stat.st_size)
+    #Write to a temporary name first, so there is never a partial partial file
+    partfh = open(partfile + ".tmp", "w", encoding="utf8", newline="\n")
+    runs = []
+    items = []
+    used = 0
+    ngrams = 0
+    first = None
+    last = None
+    try:
+        for item in readNgramShard(infile, bufsize, decompressor, progress, years):
+            ngrams += 1
+            if not runs and (last is None or item[1] >= last):
+                partfh.write("\t".join(map(str, item)) + "\n")
+                if first is None:
+                    first = item[1]
+                last = item[1]
+                continue
+            if not runs:
+                #Out of order, so what was written so far becomes the first run
+                partfh.close()
+                runs.append(partfile + ".run0")
+                os.replace(partfile + ".tmp", runs[0])
+            items.append(item)
+            #Rough size of the list slot, list, strings and ints
+            used += 250 + sum([len(str(value)) for value in item])
+            if(used > SHARD_MEMORY):
+                runs.append(writeShardRun(items, partfile + ".run%i" % len(runs)))
+                items = []
+                used = 0
+        (lines, size) = progress.endTask()
+        if runs:
+            runs.append(writeShardRun(items, partfile + ".run%i" % len(runs)))
+            items = None
+            progress.count("prepare", "sorted_runs", len(runs))
+            partfh = open(partfile + ".tmp", "w", encoding="utf8", newline="\n")
+            first = None
+            for item in heapq.merge(*[readPartFile(run) for run in runs], key=lambda item: item[1]):
+                partfh.write("\t".join(map(str, item)) + "\n")
+                if first is None:
+                    first = item[1]
+                last = item[1]
+        partfh.close()
+        os.replace(partfile + ".tmp", partfile)
+    finally:
+        partfh.close()
+        for run in runs:
+            if os.path.exists(run):
+                os.remove(run)
+    entry = {"size": stat.st_size, "mtime": stat.st_mtime,
+             "sha256": hashFile(infile), "ngrams": ngrams,
+             "first": first, "last": last, "years": years}
+    statsfile = None
+    if profiler is not None:
+        profiler.disable()
+        statsfile = partfile + ".pstats"
+        profiler.dump_stats(statsfile)
+    return (infile, entry, lines, size, progress.counters, statsfile)
+
+def writeShardRun(items, run):
+    """Write items from readNgramShard() to the file run, sorted by ngram, and
+    return its path."""
+    items.sort(key=lambda item: item[1])
+    outfh = open(run, "w", encoding="utf8", newline="\n")
+    for item in items:
+        outfh.write("\t".join(map(str, item)) + "\n")
+    outfh.close()
+    return run
+
+def readPartFile(partfile):
+    """Generator yielding (tidied, ngram, match_count, volume_count) tuples,
+    plus the per-year counts if there are any, from a partial file or run
+    written by prepareNgramShard()."""
+    partfh = open(partfile, "r", encoding="utf8", newline="\n")
+    for line in partfh:
+        item = line.rstrip("\n").split("\t")
+        yield (item[0], item[1], int(item[2]), int(item[3])) + tuple(item[4:])
+    partfh.close()
+
+def hashFile(infile):
+    """Returns the hex SHA-256 digest of the contents of infile."""
+    digest = hashlib.sha256()
+    infh = open(infile, "rb")
+    for data in iter(lambda: infh.read(1024 * 1024), b""):
+        digest.update(data)
+    infh.close()
+    return digest.hexdigest()
+
+def isShardUnchanged(infile, entry):
+    """Returns True if infile is still the same as when its checkpoint entry
+    was recorded by prepareNgramShard().
+
+    Files with the same size and modification time are assumed unchanged.
+    If only the modification time differs, the contents are hashed, and if they
+    are the same the entry is updated with the new modification time.
+
+    Keyword arguments:
+    infile -- path to the 1-gram file
+    entry -- the checkpoint entry of the file
+    """
+    stat = os.stat(infile)
+    if stat.st_size != entry["size"]:
+        return False
+    if stat.st_mtime == entry["mtime"]:
+        return True
+    if hashFile(infile) == entry["sha256"]:
+        entry["mtime"] = stat.st_mtime
+        return True
+    return False
+
+#Version of the checkpoint manifest written by prepareNgrams(), to be changed
+#whenever the format of the partial files changes
+CHECKPOINT_VERSION = 1
+
+def readCheckpoint(checkpoint):
+    """Returns the entries of a checkpoint manifest written by prepareNgrams(),
+    or an empty dict if there is none or it was written by another version.
+
+    The manifest is a JSON object with a dict of "shards", mapping the name of
+    each prepared ngram file to an entry with its "size", "mtime" and "sha256"
+    and the number of "ngrams" in its partial file, which are sorted from the
+    "first" to the "last" ngram, and whether it has the per-year counts
+    ("years").
+
+    Keyword arguments:
+    checkpoint -- path of the manifest
+    """
+    try:
+        infh = codecs.open(checkpoint, "r", "utf8")
+        manifest = json.load(infh)
+        infh.close()
+    except (IOError, ValueError):
+        return {}
+    if manifest.get("version") != CHECKPOINT_VERSION:
+        return {}
+    return manifest["shards"]
+
+def writeCheckpoint(checkpoint, directory, shards):
+    """Atomically write a checkpoint manifest, see readCheckpoint().
+
+    Keyword arguments:
+    checkpoint -- path of the manifest
+    directory -- the directory the ngram files were read from
+    shards -- dict of entries for the prepared ngram files
+    """
+    outfh = codecs.open(checkpoint + ".tmp", "w", "utf8")
+    json.dump({"version": CHECKPOINT_VERSION, "directory": directory,
+               "shards": shards}, outfh, indent=1, sort_keys=True)
+    outfh.close()
+    os.replace(checkpoint + ".tmp", checkpoint)
+
+def mergeNgramParts(partfiles):
+    """Generator yielding (tidied, ngram, match_count, volume_count) tuples from
+    a k-way merge of sorted partial files, combining entries of the same ngram.
+    Entries from partial files with per-year counts have these as a fifth
+    element, see readNgramShard().
+
+    Keyword arguments:
+    partfiles -- list of partial files written by prepareNgramShard()
+    """
+    current = None
+    for item in heapq.merge(*[readPartFile(f) for f in partfiles], key=lambda item: item[1]):
+        if current is not None and item[1] == current[1]:
+            current = (current[0], current[1], current[2]+item[2], current[3]+item[3]) + tuple([" ".join(counts) for counts in zip(current[4:], item[4:])])
+            continue
+        if current is not None:
+            yield current
+        current = item
+    if current is not None:
+        yield current
+
+class YearMatrixWriter(object):
+    """Writes the per-year match counts of ngrams to a sparse year by ngram
+    matrix, for IsogramDecadeWriter.
+
+    The matrix is a gzipped text file with one line per ngram, in the order
+    they are written, of the form (tidied_word  ngram  counts), where counts
+    are space separated "year:match_count" pairs for the years in which the
+    ngram occurs. The per-year totals are written straight away to a second
+    file named years.totals, one (year  match_count  volume_count) line per
+    year.
+
+    Keyword arguments:
+    years -- path of the file to write to
+    totals -- list of (year, match_count, volume_count) tuples, see
+              readYearCounts()
+    """
+
+    def __init__(self, years, totals):
+        totfh = open(years + ".totals", "w", encoding="utf8", newline="\n")
+        for total in totals:
+            totfh.write("%i\t%i\t%i\n" % total)
+        totfh.close()
+        self.outfh = gzip.open(years, "wt", compresslevel=6, encoding="utf8", newline="\n")
+
+    def write(self, item):
+        """Write a (tidied, ngram, match_count, volume_count, counts) item from
+        mergeNgramParts()."""
+        self.outfh.write("%s\t%s\t%s\n" % (item[0], item[1], item[4]))
+
+    def close(self):
+        """Close the file."""
+        self.outfh.close()
+
+def readYearMatrix(years, words=None):
+    """Generator yielding one (tidied, ngram, counts) tuple per line of a year
+    matrix written by YearMatrixWriter, where counts is a list of
+    (year, match_count) tuples. Counts for the same year are not combined.
+
+    If words is given, only the lines of those tidied words are yielded, and
+    the counts of the other lines are never parsed.
+
+    Keyword arguments:
+    years -- path of the year matrix
+    words -- set of tidied words to read (default None for all)
+    """
+    infh = gzip.open(years, "rt", encoding="utf8", newline="\n")
+    for line in infh:
+        (tidied, rest) = line.split("\t", 1)
+        if words is not None and tidied not in words:
+            continue
+        (ngram, counts) = rest.rstrip("\n").split("\t")
+        yield (tidied, ngram, [tuple(map(int, count.split(":")))
+                               for count in counts.split()])
+    infh.close()
+
+def readYearMatrixTotals(years):
+    """Returns the per-year totals of a year matrix as a list of (year,
+    match_count, volume_count) tuples, which is empty if there is no
+    years.totals file.
+
+    Keyword arguments:
+    years -- path of the year matrix
+    """
+    if not os.path.exists(years + ".totals"):
+        return []
+    totfh = open(years + ".totals", "r")
+    totals = [tuple(map(int, line.split("\t"))) for line in totfh if line.strip()]
+    totfh.close()
+    return totals
+
+def prepareBNC(infile, outfile, bufsize=None, decompressor="auto",
+               progress=None, wordlist_format="tsv", consolidate=False,
+               memory=None, tmpdir=None):
+    """Prepare a tidied up word list from the BNC word frequency list, in
+    preparation for running isogram() on the list.
+
+    A second file of the name outfile.totals is written which includes the total
+    word and volume counts from the corpus. This data can later be used to
+    calculate relative frequencies, and the function detectIsograms()
+    automatically looks for this file.
+
+    Consecutive entries with the same tidied word are combined. If consolidate
+    is True, entries are combined by tidied word across the whole list, see
+    consolidateItems().
+
+    Keyword arguments:
+    infile -- The input file (should be the file usually named "all.al.gz")
+    outfile -- The file for writing the resulting word list
+    bufsize -- decompression buffer size in bytes, see readGzipBlocks()
+    decompressor -- how to decompress the file, see readGzipBlocks()
+    progress -- the Progress used to report on the file (optional)
+    wordlist_format -- format of outfile, see openWordList() (default "tsv")
+    consolidate -- whether to consolidate entries by tidied word (default False)
+    memory -- memory limit for consolidating, see consolidateItems()
+    tmpdir -- directory for temporary files (default the system default)
+    """
+    if progress is None:
+        progress = Progress()
+    sys.stdout.write("Preparing word list from file %s...\n" % infile)
+    totals = {}
+    outfh = openWordList(outfile, wordlist_format)
+    items = readBNC(infile, totals, bufsize, decompressor, progress)
+    if consolidate:
+        items = consolidateItems(items, memory, tmpdir, progress)
+    for item in items:
+        outfh.write(item)
+    outfh.close()
+    if totals:
+        writeWordListTotals(outfile, totals)
+    sys.stdout.write("Done preparing word list from BNC frequency list.\n")
+
+def readBNC(infile, totals, bufsize=None, decompressor="auto", progress=None):
+    """Generator yielding one [tidied, word_pos, frequency, file_count] item per
+    tidied headword of the BNC word frequency list.
+
+    This does the work of prepareBNC() and is also used to feed detectBNC()
+    directly. As soon as the total counts are found in the list, they are put
+    into totals as "total_1grams" and "total_volumes".
+
+    Keyword arguments:
+    infile -- The input file (should be the file usually named "all.al.gz")
+    totals -- a dict to put the total counts into
+    bufsize -- decompression buffer size in bytes, see readGzipBlocks()
+    decompressor -- how to decompress the file, see readGzipBlocks()
+    progress -- the Progress used to report on the file (optional)
+    """
+    if progress is None:
+        progress = Progress()
+    current_headword = None #To keep track of and combine tokens regardless of POS
+    current_item = None
+    rejected = dict((rule, 0) for rule in BNC_REJECTION_RULES)
+    headwords = 0
+    progress.startStage("prepare")
+    progress.startTask(os.path.basename(infile), os.path.getsize(infile))
+    #Read line by line, decoding only the word and POS fields
+    for block in readGzipBlocks(infile, bufsize, decompressor, progress):
+        for line in block:
+            item = line.strip().split(b" ") #Fields separated by spaces
+            #Check for total counts (given as "!!WHOLE_CORPUS")
+            if(item[1] == b"!!WHOLE_CORPUS"):
+                totals["total_1grams"] = int(item[0])
+                totals["total_volumes"] = int(item[3])
+                sys.stdout.write("Detected total counts: %i 1-grams and %i volumes.\n" % (totals["total_1grams"], totals["total_volumes"]))
+                continue
+            word = str(item[1], encoding="utf8")
+            #Tidy string
+            tidy = tidyString(word)
+            #Ignore empty strings
+            if(len(tidy) == 0):
+                rejected["empty"] += 1
+                continue
+            #Exclude items with "%", "_", "&", "/", ":" or numbers in them
+            if(   word.find("&") > -1
+               or word.find("_") > -1
+               or word.find("%") > -1
+               or word.find("/") > -1
+               or word.find(":") > -1
+               or not tidy.isalpha()
+              ):
+                rejected[rejectionRuleBNC(word, tidy)] += 1
+                continue
+            #Exclude number-initial strings
+            if(tidy[0].isdigit()):
+                rejected["digit_initial"] += 1
+                continue
+            #Still on the same headword, so add frequencies and file_counts
+            if(tidy == current_headword):
+                current_item[2] += int(item[0]) #Add FREQ
+                current_item[3] += int(item[3]) #Add FILE_COUNT (Maybe not best of ideas?)
+                continue
+            #New headword, save current item and move on
+            if(current_headword != None):
+                headwords += 1
+                yield current_item
+            #First or new headword
+            #Reorder them, as they are FREQ, WORD, POS, FILE_COUNT
+            #We want: WORD, WORD_POS, FREQ, FILE_COUNT
+            #Similar to: tidied, original_ngram, match_count, volume_count
+            current_item = [tidy, word+"_"+str(item[2], encoding="utf8"), int(item[0]), int(item[3])]
+            current_headword = tidy
+    #Save the last headword
+    if(current_headword != None):
+        headwords += 1
+        yield current_item
+    progress.count("prepare", "headwords", headwords)
+    for (rule, count) in rejected.items():
+        progress.count("prepare", "rejected_" + rule, count)
+    progress.endTask()
+    progress.endStage()
+
+#Rules readBNC() rejects words by, in the order they are checked
+BNC_REJECTION_RULES = ["empty", "ampersand", "underscore", "percent", "slash",
+                       "colon", "not_alpha", "digit_initial"]
+
+def rejectionRuleBNC(word, tidy):
+    """Return which of the character rules in readBNC() the word with the
+    tidied form tidy was rejected by."""
+    for (character, rule) in [("&", "ampersand"), ("_", "underscore"),
+                              ("%", "percent"), ("/", "slash"), (":", "colon")]:
+        if word.find(character) > -1:
+            return rule
+    return "not_alpha"
+
+
+def openWordList(outfile, wordlist_format="tsv"):
+    """Open a word list for writing by prepareNgrams() and prepareBNC().
+
+    The returned writer has a write() method taking one (tidied, original,
+    match_count, volume_count) item at a time, and a close() method.
+
+    Keyword arguments:
+    outfile -- path of the word list
+    wordlist_format -- "tsv" for a tab separated text file, or "columns" for a
+                       ColumnarWordList (default "tsv")
+    """
+    if wordlist_format == "tsv":
+        return TabbedWordListWriter(outfile)
+    if wordlist_format == "columns":
+        return ColumnarWordListWriter(outfile)
+    raise ValueError("Unknown word list format: %s" % wordlist_format)
+
+def readWordList(infile, chunksize=100000):
+    """Generator yielding the items of a word list as lists of at most
+    chunksize [tidied, original, match_count, volume_count] lists.
+
+    Both tab separated and columnar word lists are read, the latter without
+    parsing any text but the words themselves.
+
+    Keyword arguments:
+    infile -- path of the word list
+    chunksize -- maximum number of items per chunk (default 100000)
+    """
+    if isColumnarWordList(infile):
+        wordlist = ColumnarWordList(infile)
+        try:
+            for start in range(0, len(wordlist), chunksize):
+                stop = min(start + chunksize, len(wordlist))
+                yield [list(item) for item in zip(
+                    wordlist.strings("tidied", start, stop),
+                    wordlist.strings("original", start, stop),
+                    wordlist.integers("match_count", start, stop).tolist(),
+                    wordlist.integers("volume_count", start, stop).tolist())]
+        finally:
+            wordlist.close()
+        return
+    #Plain text files split lines much faster than codecs readers
+    infh = open(infile, "r", encoding="utf8", newline="\n")
+    chunk = []
+    for line in infh:
+        chunk.append(line.strip().split("\t"))
+        if(len(chunk) >= chunksize):
+            yield chunk
+            chunk = []
+    infh.close()
+    if chunk:
+        yield chunk
+
+def exportWordList(infile, outfile):
+    """Convert a word list of either format into a tab separated word list."""
+    outfh = TabbedWordListWriter(outfile)
+    for chunk in readWordList(infile):
+        for item in chunk:
+            outfh.write(item)
+    outfh.close()
+
+class TabbedWordListWriter(object):
+    """Writes word list items as lines of tab separated text.
+
+    Keyword arguments:
+    outfile -- path of the file to write to
+    """
+
+    def __init__(self, outfile):
+        self.outfh = open(outfile, "w", encoding="utf8", newline="\n")
+
+    def write(self, item):
+        """Write a (tidied, original, match_count, volume_count) item."""
+        self.outfh.write("%s\t%s\t%s\t%s\n" % tuple(item))
+
+    def close(self):
+        """Close the file."""
+        self.outfh.close()
+
+#First bytes of a columnar word list
+COLUMNAR_MAGIC = b"ISOWORDS"
+
+#Columns of a columnar word list, and whether they hold strings or integers
+COLUMNAR_COLUMNS = [("tidied", "string"), ("original", "string"),
+                    ("match_count", "int64"), ("volume_count", "int64")]
+
+def isColumnarWordList(infile):
+    """Returns True if infile is a columnar word list."""
+    infh = open(infile, "rb")
+    magic = infh.read(len(COLUMNAR_MAGIC))
+    infh.close()
+    return magic == COLUMNAR_MAGIC
+
+class ColumnarWordListWriter(object):
+    """Writes word list items into the columnar format read by
+    ColumnarWordList.
+
+    Each column is first written to a temporary file of its own next to
+    outfile, and the columns are put together when the writer is closed.
+
+    Keyword arguments:
+    outfile -- path of the file to write to
+    """
+
+    def __init__(self, outfile):
+        self.outfile = outfile
+        self.rows = 0
+        self.parts = {}
+        self.buffers = {}
+        self.positions = {}
+        for (name, kind) in COLUMNAR_COLUMNS:
+            if kind == "string":
+                self.parts[name + ".heap"] = open(outfile + ".tmp-" + name + ".heap", "wb")
+                self.parts[name + ".offsets"] = open(outfile + ".tmp-" + name + ".offsets", "wb")
+                self.buffers[name + ".offsets"] = array.array("q", [0])
+                self.positions[name] = 0
+            else:
+                self.parts[name] = open(outfile + ".tmp-" + name, "wb")
+                self.buffers[name] = array.array("q")
+
+    def write(self, item):
+        """Write a (tidied, original, match_count, volume_count) item."""
+        for (k, (name, kind)) in enumerate(COLUMNAR_COLUMNS):
+            if kind == "string":
+                data = item[k].encode("utf8") + b"\n"
+                self.parts[name + ".heap"].write(data)
+                self.positions[name] += len(data)
+                self.buffers[name + ".offsets"].append(self.positions[name])
+            else:
+                self.buffers[name].append(int(item[k]))
+        self.rows += 1
+        if(self.rows % 65536 == 0):
+            self.flush()
+
+    def flush(self):
+        """Write out the buffered integers."""
+        for (name, values) in self.buffers.items():
+            values.tofile(self.parts[name])
+            del values[:]
+
+    def close(self):
+        """Put the columns together into outfile."""
+        self.flush()
+        for fh in self.parts.values():
+            fh.close()
+        #Lay out the sections, each aligned to 8 bytes, after the header
+        sections = {}
+        size = 0
+        for name in sorted(self.parts):
+            length = os.path.getsize(self.outfile + ".tmp-" + name)
+            sections[name] = [size, length]
+            size += (length + 7) // 8 * 8
+        header = json.dumps({"version": 1, "rows": self.rows,
+                             "byteorder": sys.byteorder,
+                             "sections": sections}).encode("utf8")
+        start = (len(COLUMNAR_MAGIC) + 8 + len(header) + 7) // 8 * 8
+        outfh = open(self.outfile, "wb")
+        outfh.write(COLUMNAR_MAGIC)
+        outfh.write(struct.pack("<Q", len(header)))
+        outfh.write(header)
+        for name in sorted(self.parts):
+            outfh.write(b"\0" * (start + sections[name][0] - outfh.tell()))
+            infh = open(self.outfile + ".tmp-" + name, "rb")
+            shutil.copyfileobj(infh, outfh, 1024 * 1024)
+            infh.close()
+            os.remove(self.outfile + ".tmp-" + name)
+        outfh.close()
+
+class ColumnarWordList(object):
+    """Read access to a columnar word list, written by prepareNgrams() or
+    prepareBNC() with wordlist_format "columns".
+
+    The file starts with COLUMNAR_MAGIC, the length of a JSON header as a
+    little-endian uint64 and the header itself, giving the number of rows and
+    the position and length of each section relative to the end of the
+    header, padded to 8 bytes. The tidied and original words are each stored as
+    a heap of newline terminated UTF-8 strings plus an int64 array of rows+1
+    offsets into the heap; the counts are int64 arrays.
+
+    The file is memory-mapped and sliced without copying, so only the words
+    that are actually read are ever decoded.
+
+    Keyword arguments:
+    infile -- path of the word list
+    """
+
+    def __init__(self, infile):
+        self.infh = open(infile, "rb")
+        self.map = mmap.mmap(self.infh.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.map[:len(COLUMNAR_MAGIC)] != COLUMNAR_MAGIC:
+            raise ValueError("Not a columnar word list: %s" % infile)
+        (length,) = struct.unpack_from("<Q", self.map, len(COLUMNAR_MAGIC))
+        header = json.loads(self.map[len(COLUMNAR_MAGIC) + 8:len(COLUMNAR_MAGIC) + 8 + length].decode("utf8"))
+        if header["byteorder"] != sys.byteorder:
+            raise ValueError("Columnar word list %s was written on a %s-endian machine" % (infile, header["byteorder"]))
+        self.rows = header["rows"]
+        start = (len(COLUMNAR_MAGIC) + 8 + length + 7) // 8 * 8
+        self.sections = {}
+        for (name, (position, size)) in header["sections"].items():
+            self.sections[name] = (start + position, size)
+
+    def __len__(self):
+        return self.rows
+
+    def section(self, name):
+        """Returns a section as a zero-copy int64 array, or a memoryview of the
+        bytes for a heap."""
+        (position, size) = self.sections[name]
+        if name.endswith(".heap"):
+            return memoryview(self.map)[position:position + size]
+        if numpy is not None:
+            return numpy.frombuffer(self.map, dtype=numpy.int64, count=size // 8, offset=position)
+        return memoryview(self.map)[position:position + size].cast("q")
+
+    def integers(self, name, start=0, stop=None):
+        """Returns rows start to stop of an integer column as a zero-copy
+        int64 array (or a memoryview if NumPy is not available)."""
+        if stop is None:
+            stop = self.rows
+        return self.section(name)[start:stop]
+
+    def strings(self, name, start=0, stop=None):
+        """Returns rows start to stop of a string column as a list of str."""
+        if stop is None:
+            stop = self.rows
+        if start >= stop:
+            return []
+        offsets = self.section(name + ".offsets")
+        heap = self.section(name + ".heap")
+        return str(heap[int(offsets[start]):int(offsets[stop])], encoding="utf8").split("\n")[:-1]
+
+    def items(self, rows):
+        """Returns the given rows as a list of [tidied, original, match_count,
+        volume_count] items, decoding only the words of those rows."""
+        items = [[] for row in rows]
+        for (name, kind) in COLUMNAR_COLUMNS:
+            if kind == "string":
+                offsets = self.section(name + ".offsets")
+                heap = self.section(name + ".heap")
+                column = [str(heap[int(offsets[row]):int(offsets[row + 1]) - 1], encoding="utf8")
+                          for row in rows]
+            else:
+                column = self.section(name)
+                column = [int(column[row]) for row in rows]
+            for (item, value) in zip(items, column):
+                item.append(value)
+        return items
+
+    def close(self):
+        """Close the file. Arrays handed out are left valid until released."""
+        try:
+            self.map.close()
+        except BufferError:
+            pass
+        self.infh.close()
+
+#Number of bytes decompressed at a time by readGzipBlocks()
+GZIP_BUFFER_SIZE = 8 * 1024 * 1024
+
+#Translation table for tidyString(): lowercases A-Z and deletes every other
+#ASCII character that is not alphanumeric
+TIDY_TABLE = dict((c, None) for c in range(128) if not chr(c).isalnum())
+TIDY_TABLE.update((c, c + 32) for c in range(ord("A"), ord("Z") + 1))
+
+#Number of non-ASCII strings whose tidied form is cached by tidyString()
+TIDY_CACHE_SIZE = 1 << 18
+
+def tidyString(string):
+    """Tidies up strings from Google Ngrams to give a uniform lowecase string
+    suitable for evaluation as an isogram.
+
+    The function removes everything after the first underscore, which is used to
+    attach Part of Speech information. It then strips the string of all
+    diacritics and special characters and finally transforms the entire string
+    to lowercase.
+
+    Pure ASCII strings are tidied with a single str.translate() call. Other
+    strings need Unicode normalisation, which is comparatively slow, so their
+    results are kept in a bounded LRU cache (see tidyCacheInfo()).
+
+    Keyword arguments:
+    string -- The string to be tidied. This should be in utf8.
+    """
+    #Strip anything appended by an underscore (i.e. POS info in Google Ngrams)
+    if "_" in string:
+        string = string[0:string.find("_")]
+
+    if string.isascii():
+        return string.translate(TIDY_TABLE)
+    return tidyUnicodeString(string)
+
+@functools.lru_cache(maxsize=TIDY_CACHE_SIZE)
+def tidyUnicodeString(string):
+    """Tidies up a non-ASCII string for tidyString(), with results cached."""
+    #Strip all combining marks
+    string = str(unicodedata.normalize('NFKD', string).encode('ASCII', 'ignore'), encoding="ASCII")
+
+    #Lowercase entire string and strip everything that is not alphanumeric
+    return string.translate(TIDY_TABLE)
+
+def tidyCacheInfo():
+    """Returns the hits, misses, maxsize and currsize of the cache used by
+    tidyString() for non-ASCII strings, as a named tuple."""
+    return tidyUnicodeString.cache_info()
+
+def isPalindrome(candidate):
+    """Returns true if the given string is a palindrome or false if it is not.
+
+    Note that the function is case sensitive, so you may want to lowercase or
+    uppercase the entire string before passing it to this function.
+    """
+    if(candidate == ''.join(reversed(candidate))):
+        return True
+    return False
+
+
+def isTautonym(candidate):
+    """Returns true if the given string is a tautonym or false if it is not.
+
+    Note that the function is case sensitive, so you may want to lowercase or
+    uppercase the entire string before passing it to this function.
+    """
+    if(len(candidate)%2 != 0):
+        return False
+    if(candidate[int(len(candidate)/2):] == candidate[:int(len(candidate)/2)]):
+        return True
+    return False
+
+
+def serveQueries(path):
+    """Answer isogramy queries on a Unix socket until interrupted.
+
+    Each client sends one word per line, and gets back the isogramy of each
+    as a line of its own, as queryStream() does, so a client can make any
+    number of queries over a single connection without starting a process
+    for each. Clients are served concurrently. A socket left at path by an
+    earlier server is replaced, but anything else there raises a ValueError.
+    The server stops on SIGINT or SIGTERM, and removes the socket file.
+
+    Keyword arguments:
+    path -- path of the Unix socket
+    """
+    async def answer(reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                writer.write(b"%i\n" % isogram(str(line, encoding="utf8", errors="replace").rstrip("\r\n")))
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve():
+        stop = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signum, stop.set)
+        server = await asyncio.start_unix_server(answer, path)
+        async with server:
+            await stop.wait()
+
+    if os.path.exists(path):
+        if not stat.S_ISSOCK(os.stat(path).st_mode):
+            raise ValueError("Not a socket: %s" % path)
+        os.remove(path)
+    try:
+        asyncio.run(serve())
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+
+def frequencyPerMillion(x, total):
+    """Calculate the frequency per million of x given total."""
+    return ((float(x)/float(total))*1000000)
+
+def percentageOfTotal(x, total):
+    """Calculate the percentage (i.e. frequency per hundred) of x given total."""
+    return ((float(x)/float(total))*100)
+
+def isHeterogram(candidate):
+    """Returns true if no character occurs more than once in the given string,
+    i.e. if it is a 1-isogram."""
+    return len(candidate) > 0 and len(set(candidate)) == len(candidate)
+
+def isAbecedarian(candidate):
+    """Returns true if the characters of the given string are in alphabetical
+    order (repeats allowed), as in "almost"."""
+    return len(candidate) > 0 and all(a <= b for (a, b) in zip(candidate, candidate[1:]))
+
+def isPyramid(candidate):
+    """Returns true if the given string is a pyramid word, i.e. if it has one
+    character once, one twice and so on up to at least two, as in "banana"."""
+    counts = sorted(collections.Counter(candidate).values())
+    return len(counts) >= 2 and counts == list(range(1, len(counts) + 1))
+
+def isLipogram(candidate):
+    """Returns true if the given string does not contain an "e"."""
+    return "e" not in candidate
+
+def palindromeRows(rows, counts):
+    """Vectorised isPalindrome() for words of equal length, see
+    registerProperty()."""
+    return (rows == rows[:, ::-1]).all(axis=1)
+
+def tautonymRows(rows, counts):
+    """Vectorised isTautonym(), see registerProperty()."""
+    length = rows.shape[1]
+    if(length % 2 != 0):
+        return numpy.zeros(len(rows), dtype=bool)
+    return (rows[:, :length // 2] == rows[:, length // 2:]).all(axis=1)
+
+def heterogramRows(rows, counts):
+    """Vectorised isHeterogram(), see registerProperty()."""
+    return counts.max(axis=1) == 1
+
+def abecedarianRows(rows, counts):
+    """Vectorised isAbecedarian(), see registerProperty()."""
+    return (rows[:, 1:] >= rows[:, :-1]).all(axis=1)
+
+def pyramidRows(rows, counts):
+    """Vectorised isPyramid(), see registerProperty()."""
+    letters = (counts > 0).sum(axis=1)
+    ordered = numpy.sort(counts, axis=1)
+    repeated = ((ordered[:, 1:] == ordered[:, :-1]) & (ordered[:, 1:] > 0)).any(axis=1)
+    return (letters >= 2) & (ordered[:, -1] == letters) & ~repeated
+
+def lipogramRows(rows, counts):
+    """Vectorised isLipogram(), see registerProperty()."""
+    return counts[:, ord("e") - ord("a")] == 0
+
+#Word properties which can be selected with --properties, as (name, column,
+#total, rows_function, word_function) tuples, see registerProperty()
+WORD_PROPERTIES = []
+
+#Properties classified by default, i.e. the original output columns
+DEFAULT_PROPERTIES = ["palindrome", "tautonym"]
+
+def registerProperty(name, column, total, rows_function, word_function):
+    """Add a word property which can be selected for classifyBatch() and
+    detectIsograms() by name.
+
+    Properties are computed from a shared profile of each word, so selecting
+    more of them costs little extra. word_function(word) returns the property
+    (True/False or an int) of any single word. rows_function(rows, counts) is
+    given the words of one length made up of the letters a-z only, as a 2D
+    array of their bytes (one row per word), and the histogram of their
+    letters a-z (one row of 26 counts per word), and returns an array with
+    the property of each word, the same as word_function would; it is only
+    used if NumPy is available.
+
+    Keyword arguments:
+    name -- name of the property, e.g. "palindrome"
+    column -- name of its output column, e.g. "is_palindrome"
+    total -- name of the number of words with the property in the totals,
+             e.g. "total_palindromes"
+    rows_function -- function classifying arrays of words, see above
+    word_function -- function classifying a single word, see above
+    """
+    WORD_PROPERTIES.append((name, column, total, rows_function, word_function))
+
+registerProperty("palindrome", "is_palindrome", "total_palindromes",
+                 palindromeRows, isPalindrome)
+registerProperty("tautonym", "is_tautonym", "total_tautonyms",
+                 tautonymRows, isTautonym)
+registerProperty("heterogram", "is_heterogram", "total_heterograms",
+                 heterogramRows, isHeterogram)
+registerProperty("abecedarian", "is_abecedarian", "total_abecedarians",
+                 abecedarianRows, isAbecedarian)
+registerProperty("pyramid", "is_pyramid", "total_pyramids",
+                 pyramidRows, isPyramid)
+registerProperty("lipogram", "is_lipogram", "total_lipograms",
+                 lipogramRows, isLipogram)
+
+def wordProperties(names=None):
+    """Return the WORD_PROPERTIES entries for a list of property names, or for
+    DEFAULT_PROPERTIES if names is None."""
+    if names is None:
+        names = DEFAULT_PROPERTIES
+    known = dict((entry[0], entry) for entry in WORD_PROPERTIES)
+    for name in names:
+        if name not in known:
+            raise ValueError("Unknown property %r, use one of %s."
+                             % (name, ", ".join(entry[0] for entry in WORD_PROPERTIES)))
+    return [known[name] for name in names]
+
+def classifyBatch(words, properties=None):
+    """Classify a list of words in one go and return a tuple of sequences
+    (isogramy, property, ...), with one entry per word in each and one
+    property sequence for each of the properties selected.
+
+    The results are the same as calling isogram() and the word function of
+    each property (see registerProperty()) on each word, i.e. by default
+    (isogramy, is_palindrome, is_tautonym) as with isogram(), isPalindrome()
+    and isTautonym(). If NumPy is available, words made up of the lowercase
+    letters a-z only (as produced by tidyString()) are grouped by length and
+    classified as arrays, using a 26-letter histogram per word for the
+    isogramy and the properties. Any other words, or all words if NumPy is
+    missing, are classified one by one.
+
+    Keyword arguments:
+    words -- list of strings to be classified
+    properties -- list of property names (default DEFAULT_PROPERTIES)
+    """
+    if numpy is None:
+        properties = wordProperties(properties)
+        return tuple([[isogram(w) for w in words]]
+                     + [[function(w) for w in words]
+                        for (name, column, total, rows_function, function) in properties])
+    n = len(words)
+    #Lay all words out in one byte buffer, if they are all ASCII
+    lengths = numpy.fromiter(map(len, words), dtype=numpy.intp, count=n)
+    starts = numpy.zeros(n, dtype=numpy.intp)
+    numpy.cumsum(lengths[:-1], out=starts[1:])
+    joined = "".join(words)
+    buf = None
+    if(joined.isascii()):
+        buf = numpy.frombuffer(joined.encode("ascii"), dtype=numpy.uint8)
+    return classifyBuffer(buf, starts, lengths, words.__getitem__, properties)
+
+def classifyHeap(heap, offsets, properties=None):
+    """Classify the words in a heap of newline terminated UTF-8 strings, as
+    stored in a columnar word list (see ColumnarWordList), and return the
+    same tuple as classifyBatch().
+
+    With NumPy, the words are classified straight from the bytes of the heap,
+    and only the words which are not made up of a-z only are decoded.
+
+    Keyword arguments:
+    heap -- bytes-like object holding the words
+    offsets -- int64 array of the offsets of the words into heap, followed by
+               the offset of the end of the last word
+    properties -- list of property names (default DEFAULT_PROPERTIES)
+    """
+    n = len(offsets) - 1
+    if numpy is None:
+        return classifyBatch([str(heap[offsets[k]:offsets[k + 1] - 1], encoding="utf8")
+                              for k in range(n)], properties)
+    starts = numpy.asarray(offsets[:-1], dtype=numpy.intp)
+    #Each word is followed by a newline
+    lengths = numpy.diff(numpy.asarray(offsets, dtype=numpy.intp)) - 1
+    buf = numpy.frombuffer(heap, dtype=numpy.uint8)
+    def word(k):
+        return str(heap[starts[k]:starts[k] + lengths[k]], encoding="utf8")
+    return classifyBuffer(buf, starts, lengths, word, properties)
+
+def classifyBuffer(buf, starts, lengths, word, properties=None):
+    """Classify n words laid out in a byte buffer for classifyBatch() or
+    classifyHeap() and return the same tuple as classifyBatch(). Requires
+    NumPy.
+
+    Keyword arguments:
+    buf -- uint8 array holding the words as ASCII or UTF-8, or None to
+           classify all words one by one
+    starts -- array of the n offsets of the words into buf
+    lengths -- array of the n lengths of the words in bytes
+    word -- function returning the k-th word as a str, for the words not made
+            up of the lowercase letters a-z only
+    properties -- list of property names (default DEFAULT_PROPERTIES)
+    """
+    properties = wordProperties(properties)
+    n = len(lengths)
+    isogramy = numpy.zeros(n, dtype=numpy.int64)
+    values = [numpy.zeros(n, dtype=numpy.int64) for entry in properties]
+    if(n == 0):
+        return tuple([isogramy] + values)
+    groups = []
+    others = []
+    if buf is not None:
+        #One group per word length. A stable sort of 16-bit integers is a
+        #radix sort, several times faster.
+        key = lengths
+        if(lengths.max() < 2**15):
+            key = lengths.astype(numpy.int16)
+        order = numpy.argsort(key, kind="stable")
+        groups = numpy.split(order, numpy.flatnonzero(numpy.diff(lengths[order])) + 1)
+    else:
+        others.append(numpy.arange(n))
+    #Classify the plain a-z words as arrays, one array per word length
+    for index in groups:
+        length = int(lengths[index[0]])
+        if(length == 0):
+            others.append(index)
+            continue
+        #One row per letter position and one column per word, so the
+        #reductions over each word run along contiguous rows
+        rows = buf[starts[index] + numpy.arange(length)[:, None]]
+        #Letters below "a" wrap around, so only a-z are below 26, and any
+        #UTF-8 bytes leave the word to be classified one by one
+        letters = rows - ord("a")
+        plain = (letters < 26).all(axis=0)
+        if not plain.all():
+            others.append(index[~plain])
+            index = index[plain]
+            rows = rows[:, plain]
+            letters = letters[:, plain]
+            if(len(index) == 0):
+                continue
+        #Letter histogram, one row per letter
+        cells = letters.astype(numpy.intp) * len(index) + numpy.arange(len(index))
+        counts = numpy.bincount(cells.ravel(), minlength=26 * len(index))
+        counts = counts.reshape(26, len(index))
+        #A word is an n-isogram if each of its distinct letters occurs n times,
+        #i.e. if the largest count times the number of letters is its length
+        most = counts.max(axis=0)
+        distinct = numpy.count_nonzero(counts, axis=0)
+        isogramy[index] = numpy.where(most * distinct == length, most, 0)
+        for (value, entry) in zip(values, properties):
+            value[index] = entry[3](rows.T, counts.T)
+    #Empty words and words with other characters are classified one by one
+    for index in others:
+        for k in index:
+            w = word(k)
+            isogramy[k] = isogram(w)
+            for (value, entry) in zip(values, properties):
+                value[k] = entry[4](w)
+    return tuple([isogramy] + values)
+
+def detectIsograms(infile, outfile, chunksize=100000, progress=None,
+                   database=None, table="ngrams", index=None, top=None, by=None,
+                   min_cpm=None, properties=None, years=None, decades=None,
+                   shards=None, partition="isogramy"):
+    """Extract isograms from a list of words.
+
+    This function reads every line from infile, which is a tab separated word
+    list of the form (tidied_word  original_word  match_count  volume_count) and
+    then writes these to outfile as (isogramy  string_length  tidied_word
+    original_word  match_count  volume_count  match_count_per_million
+    volume_count_as_percent  is_palindrome  is_tautonym), where "isogramy" is a
+    numeric value indicating the number of times each grapheme occurs in the
+    isogram. If properties is given, the columns after volume_count_as_percent
+    are those of the selected properties instead (see registerProperty()),
+    e.g. ["palindrome", "tautonym", "pyramid"] adds an is_pyramid column.
+    Relative frequencies, i.e. counts per million and percentage of
+    volumes is computed from the .totals files generated by prepateNgrams()
+    and prepareBNC(), if the file is not found these will always default to
+    zero.
+
+    A second file of the name outfile.totals is written which includes the
+    total number of 1grams and volumes from the input .totals file and the total
+    number of isograms, palindromes and tautonyms found (or the words with
+    each of the selected properties). Note that the number
+    of palindromes and tautonyms is that actually present in the word list, and
+    thus usually larger than the total number of all palindromes/tautonyms
+    which are also isograms. This is so that a relative percentage can be
+    computed to indicate which proportion of all palindromes/tautonyms in the
+    corpus are also isograms.
+
+    If database is given, the isograms and totals are also loaded straight into
+    the SQLite database, see IsogramDatabaseWriter. Either outfile or database
+    may be None, but not both. If index is given, a letter signature index of
+    the isograms is built as well, see IsogramIndexWriter. If top or min_cpm
+    is given, only the most frequent and/or sufficiently frequent isograms are
+    written, see IsogramSelection. If decades is given, the counts per million
+    of the isograms in each decade are written to it from the year matrix
+    years written by prepareNgrams(), see IsogramDecadeWriter. If shards is
+    given, the isograms are also written to a file of separately compressed
+    shards partitioned by isogramy and length or by initial letter, see
+    IsogramShardWriter.
+
+    Keyword arguments:
+    infile -- the input file, a tab separated or columnar word list (see
+              readWordList())
+    outfile -- the output file, or None
+    chunksize -- number of words to classify at once with classifyBatch()
+    progress -- the Progress used to report on the file (optional)
+    database -- path of an SQLite database to load the isograms into (optional)
+    table -- name of the database table to load the isograms into
+             (default "ngrams")
+    index -- path of a letter signature index to build (optional)
+    top, by, min_cpm -- which isograms to write, see IsogramSelection
+                        (default None for all)
+    properties -- list of property names to classify (default
+                  DEFAULT_PROPERTIES)
+    years -- path of the year matrix for decades (optional)
+    decades -- path of a file to write the per-decade frequencies to
+               (optional)
+    shards -- path of a sharded isogram file to write (optional)
+    partition -- how to partition the shards, "isogramy" or "letter"
+                 (default "isogramy")
+    """
+    if progress is None:
+        progress = Progress()
+    sys.stdout.write("Input file: " + infile + "\n")
+    writers = openIsogramWriters(outfile, database, table, index, top, by,
+                                 min_cpm, properties, years, decades, shards,
+                                 partition)
+    totals = readWordListTotals(infile)
+    #Traverse through input lines in chunks and test them for isogramy
+    progress.startStage("detect")
+    progress.startTask(os.path.basename(infile))
+    if isColumnarWordList(infile):
+        #Classify the rows in place, without reading them as items
+        wordlist = ColumnarWordList(infile)
+        try:
+            chunks = [range(start, min(start + chunksize, len(wordlist)))
+                      for start in range(0, len(wordlist), chunksize)]
+            counts = classifyWordList(chunks, totals, writers, progress,
+                                      properties,
+                                      classify=functools.partial(classifyColumns, wordlist))
+        finally:
+            wordlist.close()
+    else:
+        counts = classifyWordList(readWordList(infile, chunksize), totals,
+                                  writers, progress, properties)
+    progress.endTask()
+    progress.endStage()
+    closeIsogramWriters(writers, totals, counts, progress, properties)
+
+def selectIsograms(infile, outfile, top=None, by=None, min_cpm=None,
+                   chunksize=100000, progress=None, database=None,
+                   table="ngrams", index=None, properties=None, years=None,
+                   decades=None, shards=None, partition="isogramy",
+                   partitions=None, jobs=1):
+    """Select the most frequent and/or sufficiently frequent isograms from
+    an isogram file written by detectIsograms(), as detectIsograms() would
+    with the same top, by and min_cpm, but in a single pass over the file
+    without classifying the words again.
+
+    The totals from infile.totals are passed on unchanged to outfile.totals,
+    so they still describe the corpus and the isograms found in it.
+
+    If infile is a sharded isogram file, only the shards matching partitions
+    are read, which also works without top and min_cpm, e.g. to load only
+    some of the shards into a database, see readIsogramFile().
+
+    Keyword arguments:
+    infile -- the isogram file
+    outfile, chunksize, progress, database, table, index, top, by, min_cpm,
+        years, decades, shards, partition -- see detectIsograms()
+    properties -- list of the properties infile was classified with (default
+                  DEFAULT_PROPERTIES)
+    partitions, jobs -- which shards to read and how many to decompress in
+                        parallel, see readIsogramFile()
+    """
+    if progress is None:
+        progress = Progress()
+    sys.stdout.write("Input file: " + infile + "\n")
+    writers = openIsogramWriters(outfile, database, table, index, top, by,
+                                 min_cpm, properties, years, decades, shards,
+                                 partition)
+    totals = readIsogramTotals(infile)
+    progress.startStage("select")
+    progress.startTask(os.path.basename(infile), os.path.getsize(infile))
+    for chunk in readIsogramFile(infile, chunksize, partitions, jobs):
+        for writer in writers:
+            writer.write(chunk)
+        progress.update(len(chunk))
+    progress.endTask()
+    progress.endStage()
+    progress.startStage("write")
+    for writer in writers:
+        writer.close(totals)
+    progress.endStage()
+
+def readIsogramFile(infile, chunksize=100000, partitions=None, jobs=1):
+    """Generator yielding the rows of an isogram file written by
+    detectIsograms() as lists of at most chunksize rows, typed as returned by
+    classifyItems().
+
+    Sharded isogram files are read as well, see readIsogramShards().
+
+    Keyword arguments:
+    infile -- path of the isogram file
+    chunksize -- maximum number of rows per chunk (default 100000)
+    partitions -- list of fnmatch patterns of the shard keys to read from a
+                  sharded isogram file, e.g. ["2-*"] (default None for all)
+    jobs -- number of shards to decompress in parallel (default 1)
+    """
+    if isShardedIsogramFile(infile):
+        infh = readIsogramShards(infile, partitions, jobs)
+    elif partitions is not None:
+        raise ValueError("Not a sharded isogram file: %s" % infile)
+    else:
+        infh = open(infile, "r", encoding="utf8", newline="\n")
+    chunk = []
+    for line in infh:
+        row = line.rstrip("\n").split("\t")
+        chunk.append([int(row[0]), int(row[1]), row[2], row[3], int(row[4]),
+                      int(row[5]), 0 if row[6] == "0" else float(row[6]),
+                      0 if row[7] == "0" else float(row[7])]
+                     + [int(value) for value in row[8:]])
+        if(len(chunk) >= chunksize):
+            yield chunk
+            chunk = []
+    infh.close()
+    if chunk:
+        yield chunk
+
+def isShardedIsogramFile(infile):
+    """Returns True if infile is a sharded isogram file, i.e. it is gzipped
+    and has a shard manifest, see IsogramShardWriter."""
+    if not os.path.exists(infile + ".manifest"):
+        return False
+    infh = open(infile, "rb")
+    magic = infh.read(2)
+    infh.close()
+    return magic == b"\x1f\x8b"
+
+def readShardManifest(infile):
+    """Returns the manifest of a sharded isogram file written by
+    IsogramShardWriter.
+
+    Keyword arguments:
+    infile -- path of the sharded isogram file
+    """
+    infh = open(infile + ".manifest", "r", encoding="utf8")
+    manifest = json.load(infh)
+    infh.close()
+    if manifest.get("version") != SHARD_MANIFEST_VERSION:
+        raise ValueError("Shard manifest %s was written by another version"
+                         % (infile + ".manifest"))
+    return manifest
+
+def readIsogramShards(infile, partitions=None, jobs=1):
+    """Generator yielding the lines of the shards of a sharded isogram file
+    whose keys match any of partitions, in the order of the file.
+
+    Only the bytes of the matching shards are read, using the offsets in the
+    manifest. If jobs is greater than 1, the shards are decompressed in a pool
+    of worker processes.
+
+    Keyword arguments:
+    infile -- path of the sharded isogram file
+    partitions -- list of fnmatch patterns of the shard keys to read (default
+                  None for all)
+    jobs -- number of shards to decompress in parallel (default 1)
+    """
+    manifest = readShardManifest(infile)
+    tasks = [(infile, shard["offset"], shard["size"])
+             for shard in manifest["shards"]
+             if partitions is None or any([fnmatch.fnmatchcase(shard["key"], pattern)
+                                           for pattern in partitions])]
+    if jobs > 1 and len(tasks) > 1:
+        pool = multiprocessing.Pool(min(jobs, len(tasks)))
+        try:
+            for data in pool.imap(readIsogramShard, tasks):
+                yield from str(data, encoding="utf8").splitlines(True)
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+    else:
+        for task in tasks:
+            yield from str(readIsogramShard(task), encoding="utf8").splitlines(True)
+
+def readIsogramShard(task):
+    """Returns the decompressed bytes of one shard of a sharded isogram file,
+    possibly in a worker process for readIsogramShards().
+
+    Keyword arguments:
+    task -- tuple of (infile, offset, size) from the manifest
+    """
+    (infile, offset, size) = task
+    infh = open(infile, "rb")
+    infh.seek(offset)
+    data = infh.read(size)
+    infh.close()
+    return gzip.decompress(data)
+
+def readIsogramTotals(infile):
+    """Return a list of (name, value) tuples from the totals file written
+    next to an isogram file, see IsogramFileWriter.close()."""
+    totals = []
+    if not os.path.exists(infile + ".totals"):
+        sys.stdout.write("No totals file found for %s.\n" % infile)
+        return totals
+    infh = open(infile + ".totals", "r", encoding="utf8")
+    for line in infh:
+        (name, value) = line.rstrip("\n").split("\t")
+        totals.append((name.lstrip("!"), int(value)))
+    infh.close()
+    return totals
+
+def detectNgrams(directory, outfile, wordlist=None, chunksize=100000,
+                 progress=None, database=None, table="ngrams", index=None,
+                 jobs=1, bufsize=None, decompressor="auto", checkpoint=False,
+                 wordlist_format="tsv", consolidate=False, memory=None,
+                 top=None, by=None, min_cpm=None, properties=None, years=None,
+                 decades=None, shards=None, partition="isogramy",
+                 tmpdir=None):
+    """Extract isograms from a Google Ngrams directory in a single pass, as
+    prepareNgrams() followed by detectIsograms() would.
+
+    The items from the ngram files are classified as they are read, without
+    writing the prepared word list to disk and reading it back, unless
+    wordlist is given, and the isograms come out in the order of the files
+    (see streamNgrams()). If jobs is greater than 1, each file is classified
+    in a worker process instead (see classifyNgrams()), unless the items
+    themselves are needed for the word list, consolidating or the year matrix;
+    then, and if checkpoint is True, the files are prepared into partial files
+    and merged as in prepareNgrams(), which makes the output sorted by ngram.
+    The total_counts file is read before any ngram file, so the relative
+    frequencies are known from the start. If years is given, the year matrix
+    is written during the same pass, and can then be used for decades
+    straight away.
+
+    Keyword arguments:
+    directory -- The path of the directory where all the ngram files are located
+    outfile -- the output file for the isograms, or None
+    wordlist -- path to also write the prepared word list to (optional)
+    chunksize -- see detectIsograms()
+    progress -- the Progress used to report on each file (optional)
+    database, table, index -- see detectIsograms()
+    jobs, bufsize, decompressor, checkpoint, wordlist_format, consolidate,
+        memory, years, tmpdir -- see prepareNgrams()
+    top, by, min_cpm, properties, decades, shards, partition -- see
+        detectIsograms()
+    """
+    if progress is None:
+        progress = Progress()
+    directory = directory.rstrip("\\/")
+    sys.stdout.write("Reading directory: "+directory+"\n")
+    writers = openIsogramWriters(outfile, database, table, index, top, by,
+                                 min_cpm, properties, years, decades, shards,
+                                 partition)
+    (files, totals) = listNgramFiles(directory)
+    if totals is None:
+        totals = {"total_1grams": 0, "total_volumes": 0}
+    elif wordlist is not None:
+        writeWordListTotals(wordlist, totals)
+    workfile = wordlist or outfile or shards or database
+    if checkpoint or (jobs > 1 and (wordlist is not None or consolidate or years is not None)):
+        #The items are needed here, so the files are prepared in parallel into
+        #partial files first
+        items = readNgrams(directory, files, workfile, jobs, bufsize,
+                           decompressor, progress, checkpoint, years, tmpdir)
+    elif jobs > 1 and len(files) > 1:
+        counts = classifyNgrams(directory, files, writers, totals, jobs,
+                                chunksize, bufsize, decompressor, progress,
+                                properties)
+        closeIsogramWriters(writers, totals, counts, progress, properties)
+        return
+    else:
+        items = streamNgrams(directory, files, bufsize, decompressor,
+                             progress, years)
+    if consolidate:
+        items = consolidateItems(items, memory, tmpdir, progress)
+    counts = classifyWordList(chunkItems(items, chunksize, wordlist, wordlist_format),
+                              totals, writers, properties=properties,
+                              stages=progress)
+    closeIsogramWriters(writers, totals, counts, progress, properties)
+
+def detectBNC(infile, outfile, wordlist=None, chunksize=100000, progress=None,
+              database=None, table="bnc", index=None, bufsize=None,
+              decompressor="auto", wordlist_format="tsv", consolidate=False,
+              memory=None, top=None, by=None, min_cpm=None, properties=None,
+              shards=None, partition="isogramy", tmpdir=None):
+    """Extract isograms from the BNC word frequency list in a single pass, as
+    prepareBNC() followed by detectIsograms() would.
+
+    The items from the frequency list are classified as they are read, without
+    writing the prepared word list to disk and reading it back, unless
+    wordlist is given. Classification waits until the total counts are found
+    in the list, which is normally on its first line; if they come later,
+    the items before them are held in memory.
+
+    Keyword arguments:
+    infile -- The input file (should be the file usually named "all.al.gz")
+    outfile -- the output file for the isograms, or None
+    wordlist -- path to also write the prepared word list to (optional)
+    chunksize -- see detectIsograms()
+    progress -- the Progress used to report on the file (optional)
+    database, table, index -- see detectIsograms()
+    bufsize, decompressor, wordlist_format, consolidate, memory, tmpdir -- see
+        prepareBNC()
+    top, by, min_cpm, properties, shards, partition -- see detectIsograms()
+    """
+    if progress is None:
+        progress = Progress()
+    sys.stdout.write("Reading file: "+infile+"\n")
+    writers = openIsogramWriters(outfile, database, table, index, top, by,
+                                 min_cpm, properties, shards=shards,
+                                 partition=partition)
+    totals = {}
+    items = readBNC(infile, totals, bufsize, decompressor, progress)
+    if consolidate:
+        items = consolidateItems(items, memory, tmpdir, progress)
+    counts = classifyWordList(chunkItems(items, chunksize, wordlist, wordlist_format),
+                              totals, writers, properties=properties,
+                              stages=progress)
+    if wordlist is not None and totals:
+        writeWordListTotals(wordlist, totals)
+    closeIsogramWriters(writers, totals, counts, progress, properties)
+
+def chunkItems(items, chunksize, wordlist=None, wordlist_format="tsv"):
+    """Generator grouping word list items into lists of chunksize items, for
+    classifyWordList(), and optionally writing them to a word list on the way.
+
+    Keyword arguments:
+    items -- iterable of (tidied, original, match_count, volume_count) items
+    chunksize -- maximum number of items per chunk
+    wordlist -- path of a word list to write the items to (optional)
+    wordlist_format -- format of the word list, see openWordList()
+    """
+    outfh = None
+    if wordlist is not None:
+        outfh = openWordList(wordlist, wordlist_format)
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if outfh is not None:
+            outfh.write(item)
+        if(len(chunk) >= chunksize):
+            yield chunk
+            chunk = []
+    if outfh is not None:
+        outfh.close()
+    if chunk:
+        yield chunk
+
+def readWordListTotals(infile):
+    """Returns the totals written for a word list by prepareNgrams() or
+    prepareBNC(), as a dict with the "total_1grams" and "total_volumes", which
+    are 0 if there is no infile.totals file.
+
+    Keyword arguments:
+    infile -- path of the word list
+    """
+    try:
+        totfh = open(infile+".totals", "r")
+        totals = totfh.read()
+        totals = totals.split()
+        if(len(totals) > 3):
+            total_1grams = int(totals[2])
+            total_volumes = int(totals[3])
+        else:
+            total_1grams = 0
+            total_volumes = 0
+        totfh.close()
+    except Exception:
+        total_1grams = 0
+        total_volumes = 0
+    return {"total_1grams": total_1grams, "total_volumes": total_volumes}
+
+def openIsogramWriters(outfile, database=None, table="ngrams", index=None,
+                       top=None, by=None, min_cpm=None, properties=None,
+                       years=None, decades=None, shards=None,
+                       partition="isogramy"):
+    """Returns the list of writers for the isograms found by detectIsograms(),
+    see the description of its arguments."""
+    columns = isogramColumns(properties)
+    writers = []
+    if outfile is not None:
+        sys.stdout.write("Output file: " + outfile + "\n")
+        writers.append(IsogramFileWriter(outfile))
+    if database is not None:
+        sys.stdout.write("Output database: %s (table %s)\n" % (database, table))
+        writers.append(IsogramDatabaseWriter(database, table, columns))
+    if index is not None:
+        sys.stdout.write("Output index: " + index + "\n")
+        writers.append(IsogramIndexWriter(index))
+    if shards is not None:
+        sys.stdout.write("Output shards: %s (by %s)\n" % (shards, partition))
+        writers.append(IsogramShardWriter(shards, partition, columns))
+    if decades is not None:
+        sys.stdout.write("Output per-decade frequencies: " + decades + "\n")
+        writers.append(IsogramDecadeWriter(decades, years))
+    if top is not None or min_cpm is not None:
+        writers = [IsogramSelection(writers, top, by, min_cpm, columns)]
+    return writers
+
+def isogramColumns(properties=None):
+    """Return the columns of the rows from classifyItems() for the given list
+    of property names, as (name, type) tuples like DATABASE_COLUMNS."""
+    return DATABASE_COLUMNS[:8] + [(entry[1], "INTEGER")
+                                   for entry in wordProperties(properties)]
+
+def classifyWordList(chunks, totals, writers, progress=None, properties=None,
+                     stages=None, classify=None):
+    """Classify chunks of word list items and write the isograms among them
+    to each of the writers.
+
+    Classification is held back until totals has the "total_1grams" and
+    "total_volumes" for the relative frequencies; if it still has not got
+    them when the chunks run out, they are taken to be 0.
+
+    Returns a dict with the number of words classified as "total_words", the
+    "total_isograms" found and the total of each property (e.g.
+    "total_palindromes"), see classifyItems().
+
+    Keyword arguments:
+    chunks -- iterable of lists of [tidied, original, match_count,
+              volume_count] items, or of anything classify takes
+    totals -- dict with the totals of the word list, which may still be filled
+              in while the chunks are read
+    writers -- list of writers, see openIsogramWriters()
+    progress -- a Progress to report the number of items classified to
+                (optional)
+    properties -- list of property names to classify (default
+                  DEFAULT_PROPERTIES)
+    stages -- a Progress to book the time spent classifying and writing to,
+              as the "detect" and "write" stages, when the chunks are read in
+              another stage at the same time, see Progress.addStageTime()
+              (optional)
+    classify -- function classifying a chunk, see classifyItems() (default
+                classifyItems)
+    """
+    if classify is None:
+        classify = classifyItems
+    names = [entry[2] for entry in wordProperties(properties)]
+    counts = {"total_words": 0, "total_isograms": 0}
+    for name in names:
+        counts[name] = 0
+    waiting = []
+    def classifyChunk(chunk):
+        counts["total_words"] += len(chunk)
+        started = time.time()
+        (rows, found) = classify(chunk, totals["total_1grams"], totals["total_volumes"], properties)
+        classified = time.time()
+        for writer in writers:
+            writer.write(rows)
+        if stages is not None:
+            stages.addStageTime("detect", classified - started, len(chunk))
+            stages.addStageTime("write", time.time() - classified, len(rows))
+        counts["total_isograms"] += len(rows)
+        for (name, value) in zip(names, found):
+            counts[name] += value
+    for chunk in chunks:
+        if progress is not None:
+            progress.update(len(chunk))
+        if not totals:
+            waiting.append(chunk)
+            continue
+        for waiting_chunk in waiting:
+            classifyChunk(waiting_chunk)
+        waiting = []
+        classifyChunk(chunk)
+    if not totals:
+        totals["total_1grams"] = 0
+        totals["total_volumes"] = 0
+    for waiting_chunk in waiting:
+        classifyChunk(waiting_chunk)
+    return counts
+
+def closeIsogramWriters(writers, totals, counts, progress, properties=None):
+    """Report the numbers of isograms found and close the writers, writing
+    the totals of the word list and counts from classifyWordList() for the
+    same properties."""
+    names = [entry[2] for entry in wordProperties(properties)]
+    sys.stdout.write("Finished processing.\n")
+    sys.stdout.write("Found %i isograms" % counts["total_isograms"]
+                     + "".join([", %i %s" % (counts[name], name[len("total_"):])
+                                for name in names]) + ".\n")
+    totals = [("total_1grams", totals["total_1grams"]),
+              ("total_volumes", totals["total_volumes"]),
+              ("total_isograms", counts["total_isograms"])]
+    totals += [(name, counts[name]) for name in names]
+    for (name, value) in counts.items():
+        progress.count("detect", name[len("total_"):], value)
+    progress.startStage("write")
+    for writer in writers:
+        writer.close(totals)
+    progress.endStage()
+
+
+def classifyItems(items, total_1grams, total_volumes, properties=None):
+    """Classify a chunk of word list items and return the isograms among them
+    as rows in the format described in detectIsograms().
+
+    Returns a tuple of the list of rows and a list with the number of words
+    in the chunk which have each of the properties. Each row is a list of
+    (isogramy, length, tidied_word, original_word, match_count, volume_count,
+    match_count_per_million, volume_count_as_percent) followed by one column
+    per property, by default (is_palindrome, is_tautonym), with the counts and
+    properties as int and the relative frequencies as float, or int 0 if
+    there are no totals.
+
+    Keyword arguments:
+    items -- list of [tidied, original, match_count, volume_count] lists
+    total_1grams -- total count used for the frequency per million, or 0
+    total_volumes -- total volumes used for the volume percentage, or 0
+    properties -- list of property names to classify (default
+                  DEFAULT_PROPERTIES)
+    """
+    classified = classifyBatch([item[0] for item in items], properties)
+    return isogramRows(classified, lambda isograms: [items[k] for k in isograms],
+                       total_1grams, total_volumes)
+
+def classifyColumns(wordlist, rows, total_1grams, total_volumes,
+                    properties=None):
+    """Classify a range of rows of a columnar word list and return the
+    isograms among them as classifyItems() does.
+
+    The tidied words are classified straight from the word list, see
+    classifyHeap(), and only the rows of the isograms are read as items.
+
+    Keyword arguments:
+    wordlist -- an open ColumnarWordList
+    rows -- range of the rows to classify
+    total_1grams, total_volumes, properties -- see classifyItems()
+    """
+    offsets = wordlist.section("tidied.offsets")[rows.start:rows.stop + 1]
+    classified = classifyHeap(wordlist.section("tidied.heap"), offsets, properties)
+    return isogramRows(classified,
+                       lambda isograms: wordlist.items([rows.start + k for k in isograms]),
+                       total_1grams, total_volumes)
+
+def isogramRows(classified, lookup, total_1grams, total_volumes):
+    """Returns the rows and property counts for classifyItems() from the
+    result of classifyBatch() for a chunk of items.
+
+    Keyword arguments:
+    classified -- tuple returned by classifyBatch() for the chunk
+    lookup -- function returning the items of the chunk at a list of indices
+    total_1grams, total_volumes -- see classifyItems()
+    """
+    isogramy = classified[0]
+    values = classified[1:]
+    found = [int(numpy.count_nonzero(value)) if numpy is not None
+             else len([v for v in value if v]) for value in values]
+    #Only visit the isograms, with plain ints rather than NumPy scalars
+    if numpy is not None:
+        isograms = numpy.flatnonzero(isogramy).tolist()
+        isogramy = isogramy.tolist()
+        values = [value.tolist() for value in values]
+    else:
+        isograms = [k for k in range(len(isogramy)) if isogramy[k] > 0]
+    rows = []
+    for (k, item) in zip(isograms, lookup(isograms)):
+        row = [isogramy[k], len(item[0]), item[0], item[1],
+               int(item[2]), int(item[3]), 0, 0]
+        row += [int(value[k]) for value in values]
+        if(total_1grams > 0):
+            row[6] = frequencyPerMillion(item[2], total_1grams)
+        if(total_volumes > 0):
+            row[7] = percentageOfTotal(item[3], total_volumes)
+        rows.append(row)
+    return (rows, found)
+
+
+class IsogramFileWriter(object):
+    """Writes rows from classifyItems() to a tab separated file, and the totals
+    to a second file named outfile.totals.
+
+    Keyword arguments:
+    outfile -- path of the file to write to
+    """
+
+    def __init__(self, outfile):
+        self.outfile = outfile
+        self.outfh = open(outfile, "w", encoding="utf8", newline="\n")
+
+    def write(self, rows):
+        """Write a list of rows."""
+        self.outfh.write("".join(["\t".join(map(str, row)) + "\n" for row in rows]))
+
+    def close(self, totals):
+        """Close the file and write totals, a list of (name, value) tuples."""
+        self.outfh.close()
+        sys.stdout.write("Writing totals to file %s...   " % (self.outfile+".totals"))
+        totfh = codecs.open(self.outfile+".totals", "w", "utf8")
+        for (name, value) in totals:
+            totfh.write("!%s\t%i\n" % (name, value))
+        totfh.close()
+        sys.stdout.write("Done.\n")
+
+
+#Ways of partitioning the shards written by IsogramShardWriter
+ISOGRAM_PARTITIONS = ["isogramy", "letter"]
+
+#Version of the shard manifest written by IsogramShardWriter
+SHARD_MANIFEST_VERSION = 1
+
+def isogramShardKey(row, partition="isogramy"):
+    """Returns the key of the shard a row from classifyItems() goes into,
+    "ISOGRAMY-LENGTH" (e.g. "2-6") if partition is "isogramy", or the initial
+    letter of the tidied word (or "_" if it is not a-z) if it is "letter"."""
+    if partition == "isogramy":
+        return "%i-%i" % (row[0], row[1])
+    initial = row[2][:1]
+    return initial if "a" <= initial <= "z" else "_"
+
+class IsogramShardWriter(object):
+    """Writes rows from classifyItems() to a file of separately compressed
+    shards, one per partition (see isogramShardKey()), with the totals in a
+    second file named outfile.totals as IsogramFileWriter does.
+
+    Each shard is a complete gzip member, so the file as a whole is still a
+    valid gzipped isogram file, ordered by shard key. A manifest named
+    outfile.manifest lists the key, number of rows, byte offset and size and
+    the first and last tidied word (in sort order) of each shard, so that a
+    shard can be read on its own, see readIsogramShards(). The rows of each
+    shard are in the order they were written.
+
+    The shards are written to temporary files next to outfile until the
+    writer is closed.
+
+    Keyword arguments:
+    outfile -- path of the file to write to
+    partition -- how to partition the rows, one of ISOGRAM_PARTITIONS
+                 (default "isogramy")
+    columns -- the columns of the rows, see isogramColumns() (default
+               DATABASE_COLUMNS)
+    """
+
+    def __init__(self, outfile, partition="isogramy", columns=None):
+        if partition not in ISOGRAM_PARTITIONS:
+            raise ValueError("Unknown partition %r, use one of %s."
+                             % (partition, ", ".join(ISOGRAM_PARTITIONS)))
+        self.outfile = outfile
+        self.partition = partition
+        self.columns = [name for (name, kind) in columns or DATABASE_COLUMNS]
+        self.shards = {}
+
+    def write(self, rows):
+        """Write a list of rows into their shards."""
+        groups = {}
+        for row in rows:
+            groups.setdefault(isogramShardKey(row, self.partition), []).append(row)
+        for (key, group) in groups.items():
+            shard = self.shards.get(key)
+            if shard is None:
+                shard = {"key": key, "rows": 0, "first": group[0][2], "last": group[0][2],
+                         "outfh": gzip.open(self.outfile + ".tmp-" + key, "wt", compresslevel=6,
+                                            encoding="utf8", newline="\n")}
+                self.shards[key] = shard
+            shard["outfh"].write("".join(["\t".join(map(str, row)) + "\n" for row in group]))
+            shard["rows"] += len(group)
+            words = [row[2] for row in group]
+            shard["first"] = min(shard["first"], min(words))
+            shard["last"] = max(shard["last"], max(words))
+
+    def close(self, totals):
+        """Put the shards together into outfile and write the manifest and
+        totals, a list of (name, value) tuples."""
+        sys.stdout.write("Writing %i shards to file %s...   " % (len(self.shards), self.outfile))
+        if self.partition == "isogramy":
+            order = lambda key: tuple(map(int, key.split("-")))
+        else:
+            order = lambda key: key
+        manifest = []
+        outfh = open(self.outfile, "wb")
+        for key in sorted(self.shards, key=order):
+            shard = self.shards[key]
+            shard.pop("outfh").close()
+            shard["offset"] = outfh.tell()
+            infh = open(self.outfile + ".tmp-" + key, "rb")
+            shutil.copyfileobj(infh, outfh, 1024 * 1024)
+            infh.close()
+            os.remove(self.outfile + ".tmp-" + key)
+            shard["size"] = outfh.tell() - shard["offset"]
+            manifest.append(shard)
+        outfh.close()
+        outfh = open(self.outfile + ".manifest", "w", encoding="utf8")
+        json.dump({"version": SHARD_MANIFEST_VERSION, "partition": self.partition,
+                   "columns": self.columns, "shards": manifest}, outfh,
+                  indent=1, sort_keys=True)
+        outfh.close()
+        totfh = open(self.outfile + ".totals", "w", encoding="utf8", newline="\n")
+        for (name, value) in totals:
+            totfh.write("!%s\t%i\n" % (name, value))
+        totfh.close()
+        sys.stdout.write("Done.\n")
+
+
+class IsogramSelection(object):
+    """Passes on only some of the rows from classifyItems() to other writers:
+    those with a count per million of at least min_cpm, and/or the top rows
+    with the highest count in each group of rows with the same values in the
+    by columns (e.g. ["isogramy", "length"]), or overall if by is empty.
+
+    Rows below min_cpm are dropped straight away and the others are written on
+    as they come, unless top is given. In that case a heap of the top rows is
+    kept for each group, so memory use is proportional to top times the number
+    of groups rather than to the number of isograms, and the rows are written
+    on close(), sorted by group and then by descending count. Of rows with the
+    same count, the one which came first is preferred.
+
+    Keyword arguments:
+    writers -- list of writers to pass the rows on to, see openIsogramWriters()
+    top -- number of rows to keep per group, or None for all (default None)
+    by -- list of column names (see columns) to group the rows by for top
+          (default None, i.e. a single group)
+    min_cpm -- minimum count per million, or None for any (default None)
+    columns -- the columns of the rows, see isogramColumns() (default
+               DATABASE_COLUMNS)
+    """
+
+    def __init__(self, writers, top=None, by=None, min_cpm=None, columns=None):
+        columns = [name for (name, kind) in columns or DATABASE_COLUMNS]
+        for name in by or []:
+            if name not in columns:
+                raise ValueError("Unknown column %r, use one of %s."
+                                 % (name, ", ".join(columns)))
+        self.writers = writers
+        self.top = top
+        self.by = [columns.index(name) for name in by or []]
+        self.min_cpm = min_cpm
+        self.heaps = {}
+        self.rows = 0
+
+    def write(self, rows):
+        """Write or keep those rows which are selected so far."""
+        if self.min_cpm is not None:
+            rows = [row for row in rows if row[6] >= self.min_cpm]
+        if self.top is None:
+            for writer in self.writers:
+                writer.write(rows)
+            return
+        for row in rows:
+            self.rows += 1
+            group = tuple(row[k] for k in self.by)
+            heap = self.heaps.setdefault(group, [])
+            #Later rows rank lower than earlier rows with the same count
+            entry = (row[4], -self.rows, row)
+            if len(heap) < self.top:
+                heapq.heappush(heap, entry)
+            elif entry > heap[0]:
+                heapq.heapreplace(heap, entry)
+
+    def close(self, totals):
+        """Write the top rows of each group and close the writers, passing on
+        totals."""
+        for group in sorted(self.heaps):
+            heap = sorted(self.heaps[group], reverse=True)
+            rows = [row for (count, order, row) in heap]
+            for writer in self.writers:
+                writer.write(rows)
+        self.heaps = {}
+        for writer in self.writers:
+            writer.close(totals)
+
+
+#Columns of the isogram tables, as in create-database.sql
+DATABASE_COLUMNS = [("isogramy", "INTEGER"), ("length", "INTEGER"),
+                    ("word", "TEXT"), ("source_pos", "TEXT"),
+                    ("count", "INTEGER"), ("vol_count", "INTEGER"),
+                    ("count_per_million", "FLOAT"),
+                    ("vol_count_as_percent", "FLOAT"),
+                    ("is_palindrome", "INTEGER"), ("is_tautonym", "INTEGER")]
+
+#Pattern of the table names accepted by IsogramDatabaseWriter, which are put
+#into the SQL statements as they are
+TABLE_NAME_PATTERN = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+#Tables derived from the bnc and ngrams tables, as in create-database.sql
+DATABASE_DERIVED_TABLES = [
+    ("bnc_compacted", """
+        SELECT isogramy, length, word, source_pos,
+               SUM(count) AS count, SUM(vol_count) AS vol_count,
+               SUM(count_per_million) AS count_per_million,
+               SUM(vol_count_as_percent) AS vol_count_as_percent,
+               is_palindrome, is_tautonym
+        FROM bnc GROUP BY word"""),
+    ("ngrams_compacted", """
+        SELECT isogramy, length, word, source_pos,
+               SUM(count) AS count, SUM(vol_count) AS vol_count,
+               SUM(count_per_million) AS count_per_million,
+               SUM(vol_count_as_percent) AS vol_count_as_percent,
+               is_palindrome, is_tautonym
+        FROM ngrams GROUP BY word"""),
+    ("combined", """
+        SELECT * FROM bnc UNION SELECT * FROM ngrams"""),
+    ("combined_compacted", """
+        SELECT isogramy, length, word, source_pos,
+               SUM(count) AS count, SUM(vol_count) AS vol_count,
+               AVG(count_per_million) AS count_per_million,
+               AVG(vol_count_as_percent) AS vol_count_as_percent,
+               is_palindrome, is_tautonym
+        FROM (SELECT * FROM bnc_compacted UNION SELECT * FROM ngrams_compacted)
+        GROUP BY word"""),
+    ("intersected", """
+        SELECT bnc_compacted.isogramy AS isogramy,
+               bnc_compacted.length AS length,
+               bnc_compacted.word AS word,
+               ngrams_compacted.source_pos AS source_pos,
+               bnc_compacted.count + ngrams_compacted.count AS count,
+               bnc_compacted.vol_count + ngrams_compacted.vol_count AS vol_count,
+               (bnc_compacted.count_per_million + ngrams_compacted.count_per_million) / 2.0 AS count_per_million,
+               (bnc_compacted.vol_count_as_percent + ngrams_compacted.vol_count_as_percent) / 2.0 AS vol_count_as_percent,
+               bnc_compacted.is_palindrome AS is_palindrome,
+               bnc_compacted.is_tautonym AS is_tautonym
+        FROM bnc_compacted, ngrams_compacted
+        WHERE bnc_compacted.word = ngrams_compacted.word""")]
+
+class IsogramDatabaseWriter(object):
+    """Loads rows from classifyItems() straight into a table of an SQLite
+    database, replacing the CSV import of create-database.sql.
+
+    The table and a table_totals table are (re)created with the layout used by
+    create-database.sql. Rows are inserted with executemany() under pragmas
+    suited to a bulk load, i.e. without a rollback journal or syncing, so the
+    database should be considered lost if loading fails. On close() the totals
+    are written, the word, isogramy and length columns are indexed and, once
+    both the bnc and ngrams tables exist, the derived tables are rebuilt (see
+    buildDerivedTables()).
+
+    Keyword arguments:
+    database -- path of the SQLite database, which is created if necessary
+    table -- name of the table to load, e.g. "bnc" or "ngrams"
+    columns -- the columns of the rows, see isogramColumns() (default
+               DATABASE_COLUMNS)
+    """
+
+    def __init__(self, database, table, columns=None):
+        if not TABLE_NAME_PATTERN.match(table):
+            raise ValueError("Invalid table name: %s" % table)
+        self.table = table
+        self.db = sqlite3.connect(database, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode = OFF")
+        self.db.execute("PRAGMA synchronous = OFF")
+        self.db.execute("PRAGMA temp_store = MEMORY")
+        self.db.execute("PRAGMA cache_size = -262144")
+        columns = columns or DATABASE_COLUMNS
+        self.db.execute("DROP TABLE IF EXISTS %s" % table)
+        self.db.execute("CREATE TABLE %s (%s)" % (table, ", ".join(['"%s" %s' % column for column in columns])))
+        self.insert = "INSERT INTO %s VALUES (%s)" % (table, ", ".join(["?"] * len(columns)))
+
+    def write(self, rows):
+        """Insert a list of rows in one transaction."""
+        self.db.execute("BEGIN")
+        self.db.executemany(self.insert, rows)
+        self.db.execute("COMMIT")
+
+    def close(self, totals):
+        """Write totals, a list of (name, value) tuples, to the totals table,
+        index the table, build the derived tables and close the database."""
+        table = self.table
+        self.db.execute("DROP TABLE IF EXISTS %s_totals" % table)
+        self.db.execute("CREATE TABLE %s_totals (%s)" % (table, ", ".join(['"%s" INTEGER' % name for (name, value) in totals])))
+        self.db.execute("INSERT INTO %s_totals VALUES (%s)" % (table, ", ".join(["?"] * len(totals))), [value for (name, value) in totals])
+        sys.stdout.write("Indexing table %s...\n" % table)
+        for column in ("word", "isogramy", "length"):
+            self.db.execute("CREATE INDEX %s_%s ON %s (%s)" % (table, column, table, column))
+        buildDerivedTables(self.db)
+        self.db.close()
+
+def buildDerivedTables(db):
+    """Rebuild the compacted, combined and intersected tables described in
+    create-database.sql from the bnc and ngrams tables of the SQLite
+    connection db, if both of them exist. Returns True if they were built.
+
+    Keyword arguments:
+    db -- an sqlite3 connection in autocommit mode
+    """
+    tables = set([row[0] for row in db.execute("SELECT name FROM sqlite_master WHERE type = 'table'")])
+    if not ("bnc" in tables and "ngrams" in tables):
+        return False
+    #The derived tables need the default columns, see DEFAULT_PROPERTIES
+    columns = [name for (name, kind) in DATABASE_COLUMNS]
+    for table in ("bnc", "ngrams"):
+        if [row[1] for row in db.execute("PRAGMA table_info(%s)" % table)] != columns:
+            sys.stdout.write("Not building derived tables, as table %s has"
+                             " different properties.\n" % table)
+            return False
+    sys.stdout.write("Building derived tables...\n")
+    db.execute("BEGIN")
+    for (name, select) in DATABASE_DERIVED_TABLES:
+        db.execute("DROP TABLE IF EXISTS %s" % name)
+        db.execute("CREATE TABLE %s AS %s" % (name, select))
+        #The compacted tables are joined on word by intersected
+        if name.endswith("_compacted"):
+            db.execute("CREATE INDEX %s_word ON %s (word)" % (name, name))
+    db.execute("COMMIT")
+    return True
+
+
+class IsogramRowList(object):
+    """Collects the rows from classifyItems() in a list, e.g. to send them
+    back from a worker process, see detectNgramShard()."""
+
+    def __init__(self):
+        self.rows = []
+
+    def write(self, rows):
+        """Add a list of rows."""
+        self.rows.extend(rows)
+
+
+class IsogramDecadeWriter(object):
+    """Writes the count per million of each decade for the words among the
+    rows from classifyItems(), computed from a year matrix written by
+    prepareNgrams() (see YearMatrixWriter) when the writer is closed.
+
+    The counts are those of all ngrams in the matrix with the same tidied word,
+    so e.g. "Aback" and "aback_ADV" both add to "aback", and the output
+    file has one line per word and decade in which it occurs, of the form
+    (tidied_word  decade  match_count  match_count_per_million), sorted by word
+    and decade. The count per million is relative to the total of the decade
+    from years.totals, or 0 if that is not known.
+
+    Only the words are held in memory until the writer is closed, and then
+    their counts per decade while the matrix is read.
+
+    Keyword arguments:
+    outfile -- path of the file to write to
+    years -- path of the year matrix
+    """
+
+    def __init__(self, outfile, years):
+        self.outfile = outfile
+        self.years = years
+        self.words = set()
+
+    def write(self, rows):
+        """Note the words of a list of rows."""
+        self.words.update([row[2] for row in rows])
+
+    def close(self, totals):
+        """Read the year matrix and write the counts of the noted words."""
+        sys.stdout.write("Writing per-decade frequencies to file %s...   " % self.outfile)
+        decade_totals = collections.Counter()
+        for (year, match_count, volume_count) in readYearMatrixTotals(self.years):
+            decade_totals[year // 10 * 10] += match_count
+        counts = collections.Counter()
+        for (tidied, ngram, years) in readYearMatrix(self.years, self.words):
+            for (year, match_count) in years:
+                counts[(tidied, year // 10 * 10)] += match_count
+        outfh = open(self.outfile, "w", encoding="utf8", newline="\n")
+        for ((word, decade), match_count) in sorted(counts.items()):
+            cpm = 0
+            if decade_totals[decade] > 0:
+                cpm = frequencyPerMillion(match_count, decade_totals[decade])
+            outfh.write("%s\t%i\t%i\t%s\n" % (word, decade, match_count, cpm))
+        outfh.close()
+        sys.stdout.write("Done.\n")
+
+def letterMask(word):
+    """Returns the 26-bit mask of the letters a-z occurring in word, with bit 0
+    for "a" up to bit 25 for "z". Other characters are ignored."""
+    mask = 0
+    for letter in set(word):
+        bit = ord(letter) - 97
+        if 0 <= bit < 26:
+            mask |= 1 << bit
+    return mask
+
+def letterSignature(word):
+    """Returns the letters of word in sorted order, which is the same for all
+    anagrams of word."""
+    return "".join(sorted(word))
+
+class IsogramIndexWriter(object):
+    """Builds a letter signature index of the rows from classifyItems(), for
+    queryIndex().
+
+    The index is an SQLite database with a words table holding each distinct
+    tidied word once, with its 26-bit letter mask (see letterMask()), sorted
+    letter signature, isogramy, length and summed count, indexed by mask, by
+    signature and by isogramy and length. A masks table lists each distinct
+    letter mask with its number of words, so queries on letters a word must
+    not contain only need to look at the masks, not at all words.
+
+    Keyword arguments:
+    indexfile -- path of the index, which is replaced if it exists
+    """
+
+    def __init__(self, indexfile):
+        if os.path.exists(indexfile):
+            os.remove(indexfile)
+        self.db = sqlite3.connect(indexfile, isolation_level=None)
+        self.db.execute("PRAGMA journal_mode = OFF")
+        self.db.execute("PRAGMA synchronous = OFF")
+        self.db.execute("CREATE TABLE words (word TEXT PRIMARY KEY, mask INTEGER,"
+                        + " signature TEXT, isogramy INTEGER, length INTEGER,"
+                        + " count INTEGER) WITHOUT ROWID")
+
+    def write(self, rows):
+        """Add a list of rows, summing up the counts of repeated words."""
+        self.db.execute("BEGIN")
+        self.db.executemany("INSERT INTO words VALUES (?, ?, ?, ?, ?, ?)"
+                            + " ON CONFLICT (word) DO UPDATE"
+                            + " SET count = count + excluded.count",
+                            [(row[2], letterMask(row[2]), letterSignature(row[2]),
+                              row[0], row[1], row[4]) for row in rows])
+        self.db.execute("COMMIT")
+
+    def close(self, totals):
+        """Index the words and close the index."""
+        sys.stdout.write("Indexing letter signatures...\n")
+        self.db.execute("BEGIN")
+        self.db.execute("CREATE INDEX words_mask ON words (mask)")
+        self.db.execute("CREATE INDEX words_signature ON words (signature)")
+        self.db.execute("CREATE INDEX words_isogramy ON words (isogramy, length)")
+        self.db.execute("CREATE TABLE masks (mask INTEGER PRIMARY KEY, words INTEGER)")
+        self.db.execute("INSERT INTO masks SELECT mask, COUNT(*) FROM words GROUP BY mask")
+        self.db.execute("COMMIT")
+        self.db.execute("ANALYZE")
+        self.db.close()
+
+def queryIndex(indexfile, letters=None, mask=None, anagram=None, avoid=None,
+               isogramy=None, length=None):
+    """Look up words in a letter signature index built by detectIsograms().
+
+    Returns a list of (word, isogramy, length, count) tuples for all words
+    matching every given condition, most frequent first.
+
+    Keyword arguments:
+    indexfile -- path of the index
+    letters -- words made up of exactly this set of letters, e.g. "abc"
+    mask -- words with exactly this letter mask, see letterMask()
+    anagram -- words which are anagrams of this word
+    avoid -- words not containing any of these letters
+    isogramy -- words of this order of isogramy
+    length -- words of this length
+    """
+    conditions = []
+    values = []
+    if letters is not None:
+        conditions.append("mask = ?")
+        values.append(letterMask(letters))
+    if mask is not None:
+        conditions.append("mask = ?")
+        values.append(mask)
+    if anagram is not None:
+        conditions.append("signature = ?")
+        values.append(letterSignature(anagram))
+    if avoid is not None:
+        conditions.append("mask IN (SELECT mask FROM masks WHERE mask & ? = 0)")
+        values.append(letterMask(avoid))
+    if isogramy is not None:
+        conditions.append("isogramy = ?")
+        values.append(isogramy)
+    if length is not None:
+        conditions.append("length = ?")
+        values.append(length)
+    query = "SELECT word, isogramy, length, count FROM words"
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    query += " ORDER BY count DESC, word"
+    db = sqlite3.connect("file:%s?mode=ro" % indexfile, uri=True)
+    result = db.execute(query, values).fetchall()
+    db.close()
+    return result
+
+
+#Option giving the input of each type of corpus in a manifest
+MANIFEST_INPUTS = {"ngrams": "indir", "bnc": "infile", "batch": "infile"}
+
+#Manifest keys holding paths, which are relative to the manifest file
+MANIFEST_PATHS = ["indir", "infile", "outfile", "wordlist", "sqlite", "index",
+                  "years", "decades", "shards", "tmpdir"]
+
+#Manifest corpus types and the option selecting them
+MANIFEST_TYPES = {"ngrams": "--ngrams", "bnc": "--bnc", "batch": "--batch"}
+
+def readManifest(manifest):
+    """Read a manifest of corpora to process with runManifest() and return a
+    tuple of the number of worker slots (or None) and a list of corpora.
+
+    The manifest is a JSON file, or a TOML file if its name ends in ".toml"
+    (which needs Python 3.11 or the tomli module). It has an optional "jobs"
+    entry and a list of "corpora", each with a "type" ("ngrams", "bnc" or
+    "batch") and the command line options for that corpus without the leading
+    dashes, e.g.:
+
+        jobs = 8
+
+        [[corpora]]
+        name = "eng"
+        type = "ngrams"
+        indir = "eng-1grams"
+        outfile = "eng-isograms.csv"
+        detect = true
+        jobs = 4
+
+    Each corpus needs its input ("indir" or "infile") and an "outfile" (or
+    "sqlite" or "shards" where isograms are written), otherwise a ValueError
+    is raised. Options set to true are passed as flags. Relative paths are relative to the manifest, and name
+    defaults to the input file or directory name.
+    """
+    if manifest.endswith(".toml"):
+        if tomllib is None:
+            raise ValueError("Reading TOML manifests needs Python 3.11 or the"
+                             + " tomli module, use JSON instead.")
+        with open(manifest, "rb") as infh:
+            data = tomllib.load(infh)
+    else:
+        with open(manifest, "r", encoding="utf8") as infh:
+            data = json.load(infh)
+    base = os.path.dirname(os.path.abspath(manifest))
+    corpora = []
+    names = set()
+    for entry in data.get("corpora", []):
+        corpus = dict(entry)
+        if corpus.get("type") not in MANIFEST_TYPES:
+            raise ValueError("Unknown corpus type %r in %s, use one of %s."
+                             % (corpus.get("type"), manifest,
+                                ", ".join(sorted(MANIFEST_TYPES))))
+        for key in MANIFEST_PATHS:
+            if key in corpus:
+                corpus[key] = os.path.join(base, corpus[key])
+        if "name" not in corpus:
+            source = corpus.get("indir") or corpus.get("infile") or ""
+            corpus["name"] = os.path.basename(source.rstrip("/\\"))
+        if MANIFEST_INPUTS[corpus["type"]] not in corpus:
+            raise ValueError("Corpus %r in %s has no %s."
+                             % (corpus["name"], manifest,
+                                MANIFEST_INPUTS[corpus["type"]]))
+        #Only the isograms can go to a database or shards
+        outputs = ["outfile"]
+        if corpus["type"] == "batch" or corpus.get("detect"):
+            outputs += ["sqlite", "shards"]
+        if not any([key in corpus for key in outputs]):
+            raise ValueError("Corpus %r in %s needs one of %s."
+                             % (corpus["name"], manifest,
+                                ", ".join(outputs)))
+        if corpus["name"] in names:
+            raise ValueError("Corpus name %r appears twice in %s."
+                             % (corpus["name"], manifest))
+        names.add(corpus["name"])
+        corpora.append(corpus)
+    return (data.get("jobs"), corpora)
+
+def manifestArguments(corpus):
+    """Return the command line arguments for processing corpus from a
+    manifest, see readManifest()."""
+    args = [MANIFEST_TYPES[corpus["type"]]]
+    for (key, value) in sorted(corpus.items()):
+        if key in ("name", "type"):
+            continue
+        if key == "jobs" and corpus["type"] != "ngrams":
+            continue
+        if value is True:
+            args.append("--" + key)
+        elif value is not False and value is not None:
+            args += ["--" + key, str(value)]
+    return args
+
+def runManifest(manifest, jobs=None, progress=None):
+    """Process all corpora in manifest concurrently and return the number of
+    corpora which failed.
+
+    Each corpus is processed by a separate run of this script with the options
+    from the manifest (see readManifest()), so e.g. with "detect" the
+    decompression of one corpus overlaps with the classification of another,
+    as well as within each run. The runs share jobs worker slots (by default
+    the "jobs" from the manifest, or the number of CPUs): an ngrams corpus
+    takes as many slots as its own "jobs" (default 1) and is run with that
+    many processes, other corpora take one slot. Corpora loading into the
+    same "sqlite" database are run one after another.
+
+    The progress of every run is collected from its --progress-json reports,
+    and a status line for each corpus is reported every progress.interval
+    seconds, followed by a summary of all corpora at the end.
+
+    Keyword arguments:
+    manifest -- the manifest file
+    jobs -- number of worker slots shared by all corpora (default None)
+    progress -- Progress object for reporting (default None for Progress())
+    """
+    if progress is None:
+        progress = Progress()
+    (manifest_jobs, corpora) = readManifest(manifest)
+    if jobs is None:
+        jobs = manifest_jobs or multiprocessing.cpu_count()
+    sys.stdout.write("Processing %i corpora from %s with %i worker slots...\n"
+                     % (len(corpora), manifest, jobs))
+    statuses = asyncio.run(runCorpora(corpora, jobs, progress))
+    reportCorpora(statuses, progress, final=True)
+    return len([status for status in statuses if status["state"] != "done"])
+
+class WorkerSlots(object):
+    """Worker slots shared by the corpora in runCorpora()."""
+
+    def __init__(self, total):
+        self.total = total
+        self.free = total
+        self.condition = asyncio.Condition()
+
+    async def acquire(self, slots):
+        """Wait until slots (at most all of them) are free and take them, and
+        return the number taken."""
+        slots = max(1, min(slots, self.total))
+        async with self.condition:
+            await self.condition.wait_for(lambda: self.free >= slots)
+            self.free -= slots
+        return slots
+
+    async def release(self, slots):
+        """Return slots taken with acquire()."""
+        async with self.condition:
+            self.free += slots
+            self.condition.notify_all()
+
+async def runCorpora(corpora, jobs, progress):
+    """Run all corpora on jobs shared worker slots, reporting their status
+    while they run, and return a list with the final status of each."""
+    slots = WorkerSlots(jobs)
+    locks = {}
+    statuses = [{"name": corpus["name"], "type": corpus["type"],
+                 "outfile": corpus.get("outfile"), "state": "waiting", "started": None, "seconds": 0.0,
+                 "stage": None, "task": None, "lines": 0, "bytes": 0,
+                 "total_bytes": None, "eta": None, "stages": [],
+                 "returncode": None, "output": []} for corpus in corpora]
+    runs = []
+    for (corpus, status) in zip(corpora, statuses):
+        database = corpus.get("sqlite")
+        if database is not None:
+            lock = locks.setdefault(os.path.abspath(database), asyncio.Lock())
+        else:
+            lock = asyncio.Lock()
+        runs.append(runCorpus(corpus, status, slots, lock))
+    reporter = asyncio.ensure_future(watchCorpora(statuses, progress))
+    try:
+        await asyncio.gather(*runs)
+    finally:
+        reporter.cancel()
+    return statuses
+
+#The script run for each corpus of a manifest, see runCorpus()
+SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "isograms.py")
+
+async def runCorpus(corpus, status, slots, lock):
+    """Run isograms.py for corpus once lock and its worker slots are free,
+    keeping status up to date with its progress."""
+    wanted = corpus.get("jobs", 1) if corpus["type"] == "ngrams" else 1
+    async with lock:
+        taken = await slots.acquire(wanted)
+        try:
+            args = manifestArguments(dict(corpus, jobs=taken))
+            args += ["--progress-json", "--progress-interval", "1"]
+            status["state"] = "running"
+            status["started"] = time.time()
+            process = await asyncio.create_subprocess_exec(
+                sys.executable, SCRIPT, *args,
+                stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+            await asyncio.gather(readCorpusOutput(process.stdout, status),
+                                 readCorpusProgress(process.stderr, status))
+            status["returncode"] = await process.wait()
+        except OSError as e:
+            status["output"].append(str(e))
+            status["returncode"] = -1
+        finally:
+            await slots.release(taken)
+    status["seconds"] = time.time() - status["started"]
+    status["state"] = "done" if status["returncode"] == 0 else "failed"
+
+async def readCorpusOutput(stream, status):
+    """Keep the last lines a corpus run writes to stdout, to show if it
+    fails."""
+    while True:
+        line = await stream.readline()
+        if not line:
+            break
+        status["output"] = status["output"][-19:] + [line.decode("utf8", "replace").rstrip()]
+
+async def readCorpusProgress(stream, status):
+    """Update status from the --progress-json reports of a corpus run. Any
+    other lines (e.g. error messages) are kept with its output."""
+    while True:
+        line = await stream.readline()
+        if not line:
+            break
+        try:
+            report = json.loads(line.decode("utf8"))
+        except ValueError:
+            status["output"] = status["output"][-19:] + [line.decode("utf8", "replace").rstrip()]
+            continue
+        if report.get("event") == "stage":
+            status["stages"].append((report["stage"], report["seconds"],
+                                     report["lines"], report["bytes"]))
+            continue
+        for key in ("stage", "task", "lines", "bytes", "total_bytes", "eta"):
+            status[key] = report.get(key)
+
+async def watchCorpora(statuses, progress):
+    """Report the status of all corpora every progress.interval seconds."""
+    while True:
+        await asyncio.sleep(progress.interval)
+        reportCorpora(statuses, progress)
+
+def reportCorpora(statuses, progress, final=False):
+    """Report the status of all corpora, either while they are running or, if
+    final is True, a summary once they are all finished."""
+    if progress.quiet:
+        return
+    if progress.json:
+        for status in statuses:
+            lines = sum(stage[2] for stage in status["stages"])
+            report = {"event": "corpus" if final else "corpus_progress",
+                      "name": status["name"], "type": status["type"],
+                      "state": status["state"], "returncode": status["returncode"],
+                      "stage": status["stage"], "task": status["task"],
+                      "lines": lines if final else status["lines"],
+                      "bytes": status["bytes"], "total_bytes": status["total_bytes"],
+                      "eta": status["eta"]}
+            if final:
+                report["seconds"] = round(status["seconds"], 3)
+                report["totals"] = readCorpusTotals(status)
+            sys.stderr.write(json.dumps(report) + "\n")
+        sys.stderr.flush()
+        return
+    if not final:
+        for status in statuses:
+            line = "%-12s %-8s" % (status["name"], status["state"])
+            if status["state"] == "running" and status["task"] is not None:
+                if status["stage"] is not None:
+                    line += " %s" % status["stage"]
+                line += " %s: %i lines" % (status["task"], status["lines"])
+                if status["total_bytes"]:
+                    line += ", %.0f%%" % (100.0 * status["bytes"] / status["total_bytes"])
+                if status["eta"] is not None:
+                    line += ", ETA %i:%02i" % (status["eta"] // 60, status["eta"] % 60)
+            sys.stdout.write(line + "\n")
+        sys.stdout.write("\n")
+        sys.stdout.flush()
+        return
+    sys.stdout.write("Corpus summary:\n")
+    for status in statuses:
+        totals = readCorpusTotals(status)
+        line = "  %-12s %-7s %-6s %8.1fs" % (status["name"], status["type"],
+                                             status["state"], status["seconds"])
+        for (name, seconds, lines, size) in status["stages"]:
+            line += "  %s %i lines/%.1fs" % (name, lines, seconds)
+        if totals.get("total_isograms") is not None:
+            line += "  %i isograms" % totals["total_isograms"]
+        sys.stdout.write(line + "\n")
+        if status["state"] == "failed":
+            for output in status["output"]:
+                sys.stdout.write("    | %s\n" % output)
+    sys.stdout.flush()
+
+def readCorpusTotals(status):
+    """Return the totals a finished corpus run wrote to its OUTFILE.totals,
+    or an empty dict if there are none."""
+    outfile = status.get("outfile")
+    if outfile is None or not os.path.exists(outfile + ".totals"):
+        return {}
+    totals = {}
+    with open(outfile + ".totals", "r", encoding="utf8") as infh:
+        for line in infh:
+            item = line.rstrip("\n").split("\t")
+            if len(item) == 2 and item[0].startswith("!"):
+                totals[item[0][1:]] = int(item[1])
+    return totals
+
+
+class Progress(object):
+    """Reports progress and throughput of the preparation and batch stages.
+
+    Work is divided into stages (e.g. "prepare", "merge" or "detect"), each of
+    which processes one or more tasks, usually a file each. While a task is
+    running, update() is called with the number of lines processed and,
+    optionally, the position in the input file. A report with the lines and
+    bytes per second and the expected time remaining for the task is written
+    at most every interval seconds, either as a text line on stdout or as a
+    JSON object on stderr. summary() writes the time taken by each stage.
+
+    Work done in one stage while another is running, e.g. classifying words
+    as they are read in a single pass, is booked to its own stage with
+    addStageTime() and taken out of the running one.
+
+    Stages can also add up named counters with count() (e.g. the words
+    rejected by each filter), which writeMetrics() writes to a file along with
+    the stage timings. If profile is set, each stage is profiled with cProfile
+    and its statistics are written to the file "PROFILE.STAGE.pstats", where
+    PROFILE is the value of profile; summary() then also lists the functions
+    taking up the most time in each stage.
+
+    Keyword arguments:
+    interval -- minimum number of seconds between reports (default 2.0)
+    quiet -- if True, nothing is reported (default False)
+    json -- if True, reports are JSON lines on stderr (default False)
+    inline -- if True, text reports on a terminal overwrite each other on the
+              same line; use False when several processes report at once
+              (default True)
+    profile -- path prefix for the profile of each stage, or None for no
+               profiling (default None)
+    """
+
+    def __init__(self, interval=2.0, quiet=False, json=False, inline=True,
+                 profile=None):
+        self.interval = interval
+        self.quiet = quiet
+        self.json = json
+        self.inline = inline
+        self.profile = profile
+        self.stages = []
+        self.stage = None
+        self.task = None
+        self.counters = {}
+        self.interleaved = {}
+        self.profiler = None
+        self.profiles = []
+        self.worker_profiles = []
+
+    def arguments(self, inline=True, profile=False):
+        """Returns the arguments to create an equivalent Progress, e.g. in a
+        worker process. If profile is True, the new Progress is told to
+        profile its tasks (see prepareNgramShard()), since a profile of this
+        process would not include the work done in another one."""
+        return (self.interval, self.quiet, self.json, inline,
+                self.profile if profile else None)
+
+    def startStage(self, name):
+        """Start timing (and profiling) the stage name."""
+        self.stage = [name, time.time(), 0, 0]
+        if self.profile is not None:
+            if self.profiler is not None:
+                self.profiler.disable()
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+
+    def endStage(self):
+        """Stop timing the current stage and record it for summary()."""
+        (name, started, lines, size) = self.stage
+        self.stages.append((name, time.time() - started, lines, size))
+        self.stage = None
+        if self.profiler is not None:
+            self.profiler.disable()
+            stats = pstats.Stats(self.profiler)
+            for statsfile in self.worker_profiles:
+                stats.add(statsfile)
+                os.remove(statsfile)
+            statsfile = "%s.%s.pstats" % (self.profile, name)
+            stats.dump_stats(statsfile)
+            self.profiles.append((name, statsfile))
+            self.profiler = None
+            self.worker_profiles = []
+
+    def addStageTime(self, name, seconds, lines=0, concurrent=False):
+        """Add seconds and lines to the stage name, for work interleaved with
+        the current stage. Unless concurrent is True (e.g. the work was done in
+        a worker process), the seconds are taken out of the current stage."""
+        #Listed after the stage running when it is first added
+        index = len(self.stages) + (self.stage is not None)
+        entry = self.interleaved.setdefault(name, [index, 0.0, 0])
+        entry[1] += seconds
+        entry[2] += lines
+        if self.stage is not None and not concurrent:
+            self.stage[1] += seconds
+
+    def stageTotals(self):
+        """Returns a list of (name, seconds, lines, bytes) tuples for each
+        stage, in the order they first ran, with the totals of stages that ran
+        more than once and the time added with addStageTime() added up."""
+        ordered = list(self.stages)
+        for (name, (index, seconds, lines)) in sorted(reversed(list(self.interleaved.items())),
+                                                      key=lambda entry: entry[1][0], reverse=True):
+            ordered.insert(index, (name, seconds, lines, 0))
+        stages = {}
+        for (name, seconds, lines, size) in ordered:
+            stage = stages.setdefault(name, [name, 0.0, 0, 0])
+            stage[1] += seconds
+            stage[2] += lines
+            stage[3] += size
+        return [tuple(stage) for stage in stages.values()]
+
+    def addProfile(self, statsfile):
+        """Add the profile statistics in statsfile, e.g. from a worker process,
+        to the profile of the current stage. The file is removed once it has
+        been added."""
+        if self.profiler is not None:
+            self.worker_profiles.append(statsfile)
+        else:
+            os.remove(statsfile)
+
+    def count(self, stage, name, value=1):
+        """Add value to the counter name of stage."""
+        counters = self.counters.setdefault(stage, {})
+        counters[name] = counters.get(name, 0) + value
+
+    def addCounters(self, counters):
+        """Add the counters of another Progress, e.g. from a worker process."""
+        for (stage, names) in counters.items():
+            for (name, value) in names.items():
+                self.count(stage, name, value)
+
+    def startTask(self, name, size=None):
+        """Start a task name, reading an input of size bytes if known."""
+        now = time.time()
+        self.task = {"name": name, "size": size, "started": now,
+                     "reported": now, "lines": 0, "position": 0}
+
+    def update(self, lines, position=None):
+        """Add lines to the current task, which has now reached position bytes
+        into its input, and report if interval seconds have passed."""
+        task = self.task
+        task["lines"] += lines
+        if position is not None:
+            task["position"] = position
+        now = time.time()
+        if(now - task["reported"] >= self.interval):
+            task["reported"] = now
+            self.report("progress", now)
+
+    def endTask(self):
+        """Finish the current task, report its totals and return a tuple of
+        the lines and bytes it has read."""
+        task = self.task
+        if task["size"] is not None:
+            task["position"] = task["size"]
+        self.report("done", time.time())
+        self.addToStage(task["lines"], task["position"])
+        self.task = None
+        return (task["lines"], task["position"])
+
+    def addToStage(self, lines, size):
+        """Add lines and bytes read, e.g. by a worker process, to the current
+        stage."""
+        if self.stage is not None:
+            self.stage[2] += lines
+            self.stage[3] += size
+
+    def report(self, event, now):
+        """Write a report for the current task."""
+        if self.quiet:
+            return
+        task = self.task
+        elapsed = max(now - task["started"], 1e-9)
+        lines_per_sec = task["lines"] / elapsed
+        bytes_per_sec = task["position"] / elapsed
+        eta = None
+        if task["size"] and bytes_per_sec > 0:
+            eta = max(task["size"] - task["position"], 0) / bytes_per_sec
+        if self.json:
+            sys.stderr.write(json.dumps({
+                "event": event, "stage": self.stage and self.stage[0],
+                "task": task["name"], "lines": task["lines"],
+                "bytes": task["position"], "total_bytes": task["size"],
+                "elapsed": round(elapsed, 3),
+                "lines_per_sec": round(lines_per_sec, 1),
+                "bytes_per_sec": round(bytes_per_sec, 1),
+                "eta": eta if eta is None else round(eta, 1),
+                "pid": os.getpid()}) + "\n")
+            sys.stderr.flush()
+            return
+        line = "%s: %i lines, %i lines/s" % (task["name"], task["lines"], lines_per_sec)
+        if task["size"]:
+            line += ", %.1f MB/s, %.0f%%" % (bytes_per_sec / 1048576.0,
+                                             100.0 * task["position"] / task["size"])
+        if event == "done":
+            line += ", done in %.1fs" % elapsed
+        elif eta is not None:
+            line += ", ETA %i:%02i" % (eta // 60, eta % 60)
+        if not self.inline or not sys.stdout.isatty():
+            sys.stdout.write(line + "\n")
+        elif event == "done":
+            sys.stdout.write("\r" + line + "\033[K\n")
+        else:
+            sys.stdout.write("\r" + line + "\033[K")
+        sys.stdout.flush()
+
+    def summary(self):
+        """Write the time taken by each stage, and the profile of each stage
+        (even if quiet) if it was profiled."""
+        self.summaryProfiles()
+        stages = self.stageTotals()
+        if self.quiet or not stages:
+            return
+        if self.json:
+            for (name, seconds, lines, size) in stages:
+                sys.stderr.write(json.dumps({"event": "stage", "stage": name,
+                                             "seconds": round(seconds, 3),
+                                             "lines": lines, "bytes": size}) + "\n")
+            sys.stderr.flush()
+            return
+        sys.stdout.write("Stage timings:\n")
+        for (name, seconds, lines, size) in stages:
+            sys.stdout.write("  %-10s %8.1fs  %12i lines  %10i lines/s\n"
+                             % (name, seconds, lines, lines / max(seconds, 1e-9)))
+
+    def summaryProfiles(self):
+        """Write the functions which took up most time in each stage."""
+        for (name, statsfile) in self.profiles:
+            sys.stdout.write("Profile of stage %s (%s), by own time:\n" % (name, statsfile))
+            stats = pstats.Stats(statsfile).stats
+            functions = sorted(stats.items(), key=lambda item: item[1][2], reverse=True)
+            for (function, (calls, ncalls, tottime, cumtime, callers)) in functions[:10]:
+                sys.stdout.write("  %8.3fs %8.3fs %10i  %s\n" % (tottime, cumtime, ncalls,
+                                                                  pstats.func_std_string(function)))
+
+    def metrics(self):
+        """Return a dict with the time, lines and bytes of each stage and the
+        counters, see stageTotals()."""
+        stages = {}
+        for (name, seconds, lines, size) in self.stageTotals():
+            stages[name] = {"seconds": seconds, "lines": lines, "bytes": size}
+        for (name, counters) in self.counters.items():
+            stages.setdefault(name, {"seconds": 0.0, "lines": 0, "bytes": 0})
+            stages[name]["counters"] = dict(counters)
+        return {"stages": stages, "time": time.time(), "argv": sys.argv[1:]}
+
+    def writeMetrics(self, metricsfile):
+        """Write metrics() to metricsfile, in the Prometheus text format if its
+        name ends in ".prom" and as JSON otherwise."""
+        metrics = self.metrics()
+        outfh = open(metricsfile, "w", encoding="utf8", newline="\n")
+        if not metricsfile.endswith(".prom"):
+            json.dump(metrics, outfh, indent=2, sort_keys=True)
+            outfh.write("\n")
+            outfh.close()
+            return
+        stages = sorted(metrics["stages"].items())
+        for (metric, key, kind, description) in [
+                ("isograms_stage_seconds", "seconds", "gauge", "Time taken by each stage."),
+                ("isograms_stage_lines_total", "lines", "counter", "Lines processed by each stage."),
+                ("isograms_stage_bytes_total", "bytes", "counter", "Bytes read by each stage.")]:
+            outfh.write("# HELP %s %s\n# TYPE %s %s\n" % (metric, description, metric, kind))
+            for (name, stage) in stages:
+                outfh.write('%s{stage="%s"} %s\n' % (metric, name, stage[key]))
+        outfh.write("# HELP isograms_count_total Items counted by each stage.\n"
+                    + "# TYPE isograms_count_total counter\n")
+        for (name, stage) in stages:
+            for (counter, value) in sorted(stage.get("counters", {}).items()):
+                outfh.write('isograms_count_total{stage="%s",counter="%s"} %i\n'
+                            % (name, counter, value))
+        outfh.close()
+